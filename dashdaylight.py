@@ -4,6 +4,7 @@ import pandas as pd
 import base64
 import io
 import pyperclip  # For copying data to clipboard
+import epcache
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
@@ -79,13 +80,21 @@ def parse_and_update_data(contents, udi_threshold, sda_threshold, zone_filter, f
     if contents:
         content_type, content_string = contents.split(',')
         decoded = base64.b64decode(content_string)
-        csv_data = io.StringIO(decoded.decode('utf-8'))
-        
-        try:
-            df = pd.read_csv(csv_data)
-        except Exception as e:
-            print("Error parsing CSV:", str(e))
-            return [], [], []
+
+        # Re-uploads of the same file load from the disk cache instead of re-parsing
+        cache_key = epcache.content_key('daylight', epcache.digest(decoded))
+        cached = epcache.load_frame(cache_key)
+        if cached is not None:
+            df = cached[0]
+        else:
+            csv_data = io.StringIO(decoded.decode('utf-8'))
+
+            try:
+                df = pd.read_csv(csv_data)
+            except Exception as e:
+                print("Error parsing CSV:", str(e))
+                return [], [], []
+            epcache.save_frame(cache_key, df)
 
     if df.empty:
         return [], [], [], []  # Ensure four outputs
@@ -10,6 +10,7 @@ import dash_daq as daq
 import plotly.graph_objects as go
 import numpy as np
 from PIL import Image
+import epfigure
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
@@ -100,6 +101,7 @@ def display_image(contents):
     fig.update_xaxes(visible=False, range=[0, width])
     fig.update_yaxes(visible=False, range=[0, height])
     fig.update_layout(width=800, height=600, dragmode='pan')
+    epfigure.log_payload('Image overlay', fig)
     
     if df.empty:
         return fig, []
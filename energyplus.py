@@ -1,15 +1,29 @@
+import hashlib
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import base64
-import io
+from plotly.io.json import to_json_plotly
 import dash
 from dash import Dash, dcc, html, Input, Output, State, ALL, dash_table
 from datetime import datetime
+import epdata
+import epengine
+import epexpr
+import epfigure
+import epfilter
+import eprules
+import epstage
 COLOR_PALETTE = ["#00012A", "#000380", "#62BB4D", "#336327", "#808080", "#00CFF2", "#878787", "#72D959", "#C7C7C7", "#7EF063"]
 
 app = Dash(__name__)
 server = app.server
-df = pd.DataFrame()
+dataset = None  # Parsed upload (see epdata): float32 matrix of timesteps x series plus index arrays
+rule_library = eprules.load_rule_library()  # Named compliance presets (built-in plus EP_RULES_FILE)
+PRESET_BUTTONS = list(eprules.BUILTIN_PRESETS)  # Preset of each example button, in button order
+
+# Last stages of the computation graph (see epstage): mask -> sorted values -> zone stats -> these
+figures = epstage.Stage('figure', 16)  # (filter key, parameter, zones, bands) -> band figure
+tables = epstage.Stage('tables', 48)  # (table, filter key, parameter, zones, inputs) -> (data, columns)
 
 app.layout = html.Div([
     html.H1("Design Builder Dynamic Data Band Analyzer"),
@@ -19,6 +33,8 @@ app.layout = html.Div([
         children=html.Button('Upload CSV File'),
         multiple=False
     ),
+    dcc.Store(id='dataset-id'),  # Id of the parsed upload held by epdata
+    dcc.Store(id='output-hashes'),  # Content hash of each output the browser holds (see update_outputs)
     
     dcc.Dropdown(id='parameter-dropdown', placeholder="Select Parameter"),
 
@@ -45,12 +61,14 @@ app.layout = html.Div([
     html.Button("DQLS CO2", id='bands-example-btn-3', n_clicks=0, style={'marginLeft': '5px'})
 ]),
     html.Div([
-    html.Label("Enter Fail Thresholds (format: value:hours, e.g. 25:80,28:40)"),
+    html.Label("Enter Fail Thresholds (format: value:hours, e.g. 25:80,28:40; run:above:25:6 caps consecutive hours, episodes:above:25:3 the number of runs)"),
     dcc.Input(id='fail-thresholds', type='text', value='25:80,28:40'),
     html.Button("PMV", id='thresholds-example-btn-1', n_clicks=0, style={'marginLeft': '10px'}),
     html.Button("DQLS T", id='thresholds-example-btn-2', n_clicks=0, style={'marginLeft': '5px'}),
     html.Button("DQLS CO2", id='thresholds-example-btn-3', n_clicks=0, style={'marginLeft': '5px'})
 ]),
+    dcc.Dropdown(id='preset-dropdown', options=[{'label': name, 'value': name} for name in rule_library],
+                 placeholder="Select Compliance Preset"),
     
 
 
@@ -68,6 +86,8 @@ app.layout = html.Div([
         value=[0, 6],  # Default to select the whole week
         marks={i: day for i, day in enumerate(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])}
     ),
+    html.Label("Filter Expression (e.g. hour in 9..17 and weekday and outdoor_db >= 10 and month in [12,1,2])"),
+    dcc.Input(id='filter-expression', type='text', debounce=True, style={'width': '60%'}),
     
     
     dcc.Graph(id='data-graph'),
@@ -88,187 +108,148 @@ app.layout = html.Div([
 
 @app.callback(
     [Output('parameter-dropdown', 'options'),
-     Output('zone-checklist', 'options'),
-     Output('zone-checklist', 'value')],
-    [Input('upload-data', 'contents'),
-     Input('zone-filter', 'value'),
-     Input('filter-mode', 'value')]  # <-- Added filter mode toggle
+     Output('dataset-id', 'data')],
+    Input('upload-data', 'contents')
 )
-def parse_data(contents, filter_word, filter_mode):  # <-- Updated function signature
-    global df
+def parse_data(contents):
+    """Parses an upload once; zone filtering runs against the cached dataset."""
+    global dataset
     if contents is None:
-        return [], [], []
-    
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    csv_data = io.StringIO(decoded.decode('utf-8'))
-    
+        return [], None
+
     try:
-        df_raw = pd.read_csv(csv_data, skiprows=2, header=None)
-        param_names = df_raw.iloc[0, 1:].tolist()
-        zone_names = df_raw.iloc[1, 1:].tolist()
-        new_columns = ['Datetime'] + [f'{zone} {param}' for zone, param in zip(zone_names, param_names)]
-        df = df_raw.iloc[2:].reset_index(drop=True)
-        
-        df.columns = new_columns
-        df.columns = [col.strip() for col in new_columns]  # Remove extra spaces
-        for col in df.columns[1:]:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        df['Datetime'] = df['Datetime'].astype(str).str[7:]
-        df['Datetime'] = pd.to_datetime(df['Datetime'], format='%b %d %I:%M %p', errors='coerce')
-        df = df.dropna(subset=['Datetime'])
-        
-        df['Date'] = df['Datetime'].dt.date  # Extract the date without time
-        
-        parameters = set(param_names)
-        zones = set(zone_names)
-
-        # **Apply Include/Exclude Filter**
-        if filter_word:
-            filter_word = filter_word.lower().strip()  # Normalize input
-            if filter_mode == 'exclude':
-                zones = [z for z in zones if filter_word not in z.lower()]  # Remove matching zones
-            elif filter_mode == 'include':
-                zones = [z for z in zones if filter_word in z.lower()]  # Keep only matching zones
-
-        return ([{'label': p, 'value': p} for p in parameters],
-                [{'label': z, 'value': z} for z in zones],
-                list(zones))
-    
+        dataset = epdata.load_dataset(contents)
     except Exception as e:
         print("Error parsing CSV:", str(e))
-        return [], [], []
+        return [], None
+
+    return [{'label': p, 'value': p} for p in dataset['parameters']], dataset['id']
+
+
+@app.callback(
+    [Output('zone-checklist', 'options'),
+     Output('zone-checklist', 'value')],
+    [Input('dataset-id', 'data'),
+     Input('zone-filter', 'value'),
+     Input('filter-mode', 'value')]
+)
+def filter_zone_checklist(dataset_id, filter_word, filter_mode):
+    dataset = epdata.get_dataset(dataset_id)
+    if dataset is None:
+        return [], []
+
+    # **Apply Include/Exclude Filter**
+    zones = epdata.filter_zones(dataset['zones'], filter_word, filter_mode)
+    return [{'label': z, 'value': z} for z in zones], zones
 
 @app.callback(
     Output('date-picker-container', 'children'),
-    Input('add-date-range', 'n_clicks'),
-    State('date-picker-container', 'children')
+    Input('add-date-range', 'n_clicks')
 )
-def add_date_picker(n_clicks, children):
+def add_date_picker(n_clicks):
     new_picker = dcc.DatePickerRange(
         id={'type': 'date-picker-range', 'index': n_clicks},
         start_date='1900-01-01',
         end_date=None,
         display_format='YYYY-MM-DD'
     )
+    children = dash.Patch()  # Append in the browser instead of sending the existing pickers back
     children.append(html.Div(new_picker))
     return children
 
-@app.callback(
-    Output('data-graph', 'figure'),
-    [Input('parameter-dropdown', 'value'),
-     Input('zone-checklist', 'value'),
-     Input('bands-input', 'value'),
-     Input({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
-     Input({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
-     Input('time-slider', 'value'),
-     Input('day-slider', 'value'),
-     Input('temp-filter', 'value')]  # <== Ensure this is here
-)
-def update_graph(parameter, selected_zones, bands, start_dates, end_dates, time_range, day_range, temp_threshold):
-    #print(f"Received temp_threshold: {temp_threshold}")  # Debugging
-
-    if df.empty or not parameter or not selected_zones:
-        return go.Figure()
+def update_total_hours(dataset_id, start_dates, end_dates, time_range, day_range, temp_threshold, expression):
+    """Shows how many hours pass the filters; overlapping date ranges are only counted once."""
+    if dataset is None or dataset_id != dataset['id']:
+        return ""
 
-    df_filtered = df.copy()
-
-    # Print initial size
-    #print(f"Initial DataFrame size: {df_filtered.shape}")
-
-    # Ensure the temp filter is valid
-    if temp_threshold is None:
-        temp_threshold = 10  # Default to 10°C
-    #print("Available columns:", df_filtered.columns.tolist())
-    if 'Environment [1] Site Outdoor Air Drybulb Temperature  (C)' in df_filtered.columns:
-    # Convert everything to string first, remove quotes, then convert to float
-        df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] = pd.to_numeric(
-            df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'].astype(str).str.replace('"', '', regex=False),
-            errors='coerce'
-        )
-    
-        # Print debug info
-        #print("Temperature values after conversion:", df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'].head(10).tolist())
-    
-        # Apply filtering
-        df_filtered = df_filtered[df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] >= temp_threshold]
-    
-        #print(f"Filtered DataFrame size: {df_filtered.shape}")  # Debugging
+    _, rows = epfilter.row_filter(dataset, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    error = epfilter.expression_error(dataset, expression)
 
+    # The filters changed: summarise the other parameters in the background (within the cache budget) so the dropdown switches instantly
+    key = filter_key(start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    epengine.warm_sorted_indexes(dataset, key, rows)
+    epstage.report()
+    if error:
+        return f"Total Hours: {len(rows)} (filter expression ignored: {error})"
+    return f"Total Hours: {len(rows)}"
 
+def triggered_props():
+    """The 'component.property' ids that triggered the running callback (empty outside a callback)."""
+    try:
+        return set(dash.callback_context.triggered_prop_ids)
+    except dash.exceptions.MissingCallbackContextException:
+        return set()
 
-    # Apply filtering
-    #df_filtered = df_filtered[df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] >= temp_threshold]
+def triggered_by(*component_ids):
+    """True when the running callback was triggered by one of the given components (False outside a callback)."""
+    try:
+        return dash.callback_context.triggered_id in component_ids
+    except dash.exceptions.MissingCallbackContextException:
+        return False
+
+def filter_key(start_dates, end_dates, time_range, day_range, temp_threshold, expression):
+    """Key of the current dataset and filter state, which every cached stage key starts from."""
+    return epfilter.filter_key(dataset['id'], start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+
+def sorted_values(parameter, start_dates, end_dates, time_range, day_range, temp_threshold, expression):
+    """Sorted-value index of a parameter for the current filter state (see epengine.sorted_index)."""
+    # Shared, memoized filter evaluation (see epfilter)
+    _, rows = epfilter.row_filter(dataset, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    key = filter_key(start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    return epengine.sorted_index(dataset, key, rows, parameter)
+
+def rule_results(parameter, selected_zones, rules, start_dates, end_dates, time_range, day_range, temp_threshold, expression, bands=()):
+    """Per-zone statistics, band counts and fail-threshold results for the selected zones (see eprules.evaluate_rules)."""
+    index = sorted_values(parameter, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    timeline = None
+    if eprules.needs_timeline(rules):  # Run rules follow the filtered hours in time order
+        mask, _ = epfilter.row_filter(dataset, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+        timeline = epengine.zone_timeline(dataset, mask, selected_zones, parameter)
+    return eprules.evaluate_rules(index, selected_zones, rules, timeline, bands)
+
+def zone_band_counts(parameter, selected_zones, bands, start_dates, end_dates, time_range, day_range, temp_threshold, expression, live=False):
+    """Band counts (zones x bands) for the current inputs.
+
+    Without date ranges or a filter expression the hour and day sliders are answered from
+    the precomputed count cube; otherwise from the sorted values of the filtered rows.
+    """
+    if not epfilter.date_intervals(start_dates, end_dates) and not epfilter.expression_text(expression):
+        # Build the cube when a slider moved (or is being dragged); otherwise only use one that already exists
+        slider_moved = live or triggered_by('time-slider', 'day-slider')
+        cube = epengine.count_cube(dataset, parameter, bands, temp_threshold, build=slider_moved)
+        if cube is not None:
+            return epengine.cube_band_counts(cube, selected_zones, time_range, day_range)
+
+    # Band edits are answered from the sorted values of the current filter state
+    index = sorted_values(parameter, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    return epengine.zone_stats(index, selected_zones, bands)['band_counts']
+
+def update_graph(parameter, selected_zones, bands, start_dates, end_dates, time_drag, day_drag, temp_threshold, expression, time_range, day_range):
+    if dataset is None or not parameter or not selected_zones:
+        return go.Figure()
 
-    # Print size after filtering
-    #print(f"Filtered DataFrame size: {df_filtered.shape}")
+    time_range = time_drag or time_range
+    day_range = day_drag or day_range
+    bands = epengine.parse_bands(bands)
 
-    df_filtered['Day_of_Week'] = df_filtered['Datetime'].dt.dayofweek  # Monday = 0, Sunday = 6
+    if not bands:  # Prevent empty list errors
+        return go.Figure()  # Return an empty figure if no bands are provided
 
-    # Apply day filter
-    start_day, end_day = day_range
-    df_filtered = df_filtered[(df_filtered['Day_of_Week'] >= start_day) &
-                              (df_filtered['Day_of_Week'] <= end_day)]
+    key = (filter_key(start_dates, end_dates, time_range, day_range, temp_threshold, expression),
+           parameter, tuple(selected_zones), tuple(bands))
+    fig = figures.get(key)
+    if fig is not None:
+        return fig
 
-    # Adjust for New Zealand Daylight Savings Time (NZDT)
-    # NZDT is from last Sunday in September to first Sunday in April
-    def is_daylight_savings(date):
-        if date.month < 4 or date.month > 9:  # April - September
-            return True  # Daylight savings is active
-        return False  # Standard time
-    
-    # Create a new column for adjusted time
-    df_filtered['Adjusted_Hour'] = df_filtered['Datetime'].apply(
-        lambda dt: dt.hour - 1 if is_daylight_savings(dt) else dt.hour
-    )
-    
-    # Filter by Date
-    if any(start_dates) and any(end_dates):
-        filtered_frames = []
-        for start_date, end_date in zip(start_dates, end_dates):
-            if start_date and end_date:
-                mask = (df_filtered['Datetime'].dt.date >= pd.to_datetime(start_date).date()) & \
-                       (df_filtered['Datetime'].dt.date <= pd.to_datetime(end_date).date())
-                filtered_frames.append(df_filtered[mask])
-    
-        if filtered_frames:
-            df_filtered = pd.concat(filtered_frames)
-    
-    # Filter by Adjusted Time (instead of normal hour)
-    if time_range:
-        start_hour, end_hour = time_range
-        df_filtered = df_filtered[(df_filtered['Adjusted_Hour'] >= start_hour) & 
-                                  (df_filtered['Adjusted_Hour'] <= end_hour)]
-    bands = [float(x) for x in bands.split(',') if x.strip()]  # Ignore empty values
+    band_labels = epengine.band_labels(bands)
+    counts = zone_band_counts(parameter, selected_zones, bands, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
 
-    if not bands:  # Prevent empty list errors
-        return go.Figure()  # Return an empty figure if no bands are provided
-    
-    bands.sort()
-    band_labels = [f'Below {bands[0]}'] + [f'{bands[i]}-{bands[i+1]}' for i in range(len(bands)-1)] + [f'Above {bands[-1]}']
-    
-    band_counts = {zone: {label: 0 for label in band_labels} for zone in selected_zones}
-    
-    for zone in selected_zones:
-        col_name = f'{zone} {parameter}'
-        if col_name in df_filtered.columns:
-            for value in df_filtered[col_name].dropna():
-                if value < bands[0]:
-                    band_counts[zone][f'Below {bands[0]}'] += 1
-                elif value > bands[-1]:
-                    band_counts[zone][f'Above {bands[-1]}'] += 1
-                else:
-                    for i in range(len(bands) - 1):
-                        if bands[i] <= value < bands[i + 1]:
-                            band_counts[zone][f'{bands[i]}-{bands[i + 1]}'] += 1
-    
     fig = go.Figure()
     for i, band_label in enumerate(band_labels):
         color = COLOR_PALETTE[i % len(COLOR_PALETTE)]  # Cycle through colors if there are more bands than colors
         fig.add_trace(go.Bar(
             x=list(selected_zones),
-            y=[band_counts[zone][band_label] for zone in selected_zones],
+            y=counts[:, i].astype(np.int32),  # Sent as a base64 int32 typed array (see epfigure)
             name=band_label,
             marker=dict(color=color)  # Assign the specific color
         ))
@@ -279,287 +260,99 @@ def update_graph(parameter, selected_zones, bands, start_dates, end_dates, time_
         xaxis_title='Zones',
         yaxis_title='Hours in Band'
     )
-    return fig
+    return figures.put(key, fig)
 
-@app.callback(
-    Output('data-table', 'data'),
-    Output('data-table', 'columns'),
-    [Input('parameter-dropdown', 'value'),
-     Input('zone-checklist', 'value'),
-     Input('bands-input', 'value'),
-     Input('fail-thresholds', 'value'),
-     Input({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
-     Input({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
-     Input('time-slider', 'value'),
-     Input('day-slider', 'value'),
-     Input('temp-filter', 'value')]  # <== Ensure this is here]  # <-- ADD THIS LINE
-)
-
-def update_table(parameter, selected_zones, bands, fail_thresholds, start_dates, end_dates, time_range, day_range, temp_threshold):  # <-- Add time_range here
-    
-    if df.empty or not parameter or not selected_zones or not fail_thresholds:
+def update_table(parameter, selected_zones, bands, fail_thresholds, start_dates, end_dates, time_drag, day_drag, temp_threshold, expression, time_range, day_range, live=False):  # <-- Add time_range here
+    """Band counts and fail columns per zone. While a slider is dragged (live) the band counts come
+    from the count cube like the graph's, and the fail columns are left blank until release."""
+    if dataset is None or not parameter or not selected_zones or not fail_thresholds:
         return [], []
 
-    df_filtered = df.copy()
-    
-    if temp_threshold is None:
-        temp_threshold = 10  # Default to 10°C
-    #print("Available columns:", df_filtered.columns.tolist())
-    if 'Environment [1] Site Outdoor Air Drybulb Temperature  (C)' in df_filtered.columns:
-    # Convert everything to string first, remove quotes, then convert to float
-        df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] = pd.to_numeric(
-            df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'].astype(str).str.replace('"', '', regex=False),
-            errors='coerce'
-        )
-    
-        # Print debug info
-        #print("Temperature values after conversion:", df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'].head(10).tolist())
-    
-        # Apply filtering
-        df_filtered = df_filtered[df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] >= temp_threshold]
-    
-        #print(f"Filtered DataFrame size: {df_filtered.shape}")  # Debugging
-    
-    df_filtered['Day_of_Week'] = df_filtered['Datetime'].dt.dayofweek
-    start_day, end_day = day_range
-    df_filtered = df_filtered[(df_filtered['Day_of_Week'] >= start_day) &
-                              (df_filtered['Day_of_Week'] <= end_day)]
-    # Adjust for New Zealand Daylight Savings Time (NZDT)
-    # NZDT is from last Sunday in September to first Sunday in April
-    def is_daylight_savings(date):
-        if date.month < 4 or date.month > 9:  # April - September
-            return True  # Daylight savings is active
-        return False  # Standard time
-    
-    # Create a new column for adjusted time
-    df_filtered['Adjusted_Hour'] = df_filtered['Datetime'].apply(
-        lambda dt: dt.hour - 1 if is_daylight_savings(dt) else dt.hour
-    )
-    
-    # Filter by Date
-    if any(start_dates) and any(end_dates):
-        filtered_frames = []
-        for start_date, end_date in zip(start_dates, end_dates):
-            if start_date and end_date:
-                mask = (df_filtered['Datetime'].dt.date >= pd.to_datetime(start_date).date()) & \
-                       (df_filtered['Datetime'].dt.date <= pd.to_datetime(end_date).date())
-                filtered_frames.append(df_filtered[mask])
-    
-        if filtered_frames:
-            df_filtered = pd.concat(filtered_frames)
-    
-    # Filter by Adjusted Time (instead of normal hour)
-    if time_range:
-        start_hour, end_hour = time_range
-        df_filtered = df_filtered[(df_filtered['Adjusted_Hour'] >= start_hour) & 
-                                  (df_filtered['Adjusted_Hour'] <= end_hour)]
-    bands = [float(x) for x in bands.split(',') if x.strip()]  # Ignore empty values
+    time_range = time_drag or time_range
+    day_range = day_drag or day_range
+
+    bands = epengine.parse_bands(bands)
 
     if not bands:
         return [], []  # Prevent further processing if bands is empty
-    
-    bands.sort()
-    band_labels = [f'Below {bands[0]}'] + [f'{bands[i]}-{bands[i+1]}' for i in range(len(bands)-1)] + [f'Above {bands[-1]}']
-
-    # Parse fail thresholds
-    fail_checks = []
-    try:
-        fail_checks = []
-        for pair in fail_thresholds.split(','):
-            parts = pair.split(':')
-            
-            if len(parts) == 2:  # Old format (above threshold only, e.g., "25:80")
-                value, hours = parts
-                fail_checks.append(("above", float(value), int(hours)))  # Assume "above" if no direction is given
-            elif len(parts) == 3:  # New format (explicit "above" or "below", e.g., "above:25:80")
-                direction, value, hours = parts
-                if direction not in ["above", "below"]:
-                    print(f"Invalid threshold format: {pair}")  # Debugging: Warn about invalid input
-                    continue  # Skip invalid formats
-                fail_checks.append((direction, float(value), int(hours)))
-            else:
-                print(f"Error parsing fail thresholds: {pair}")  # Debugging: Catch unexpected errors
-    except Exception as e:
-        print("Error parsing fail thresholds:", str(e))
-        return [], []
-
-    # Create a DataFrame to store counts
-    band_counts = {zone: {label: 0 for label in band_labels} for zone in selected_zones}
-    zone_failures = {zone: {} for zone in selected_zones}  # Stores separate statuses per threshold
 
-    print("Available columns in DataFrame:", df_filtered.columns.tolist())  # Debugging: print column names
-
-    for zone in selected_zones:
-        matching_cols = [col for col in df_filtered.columns if zone in col and parameter in col]
-        
-        if not matching_cols:
-            print(f"Warning: No match found for zone '{zone}' and parameter '{parameter}' in DataFrame.")
-            continue  # Skip this zone if no match found
-    
-        col_name = matching_cols[0]  # Use the first matching column
-
-        # Assign values to bands
-        for value in df_filtered[col_name].dropna():
-            if value < bands[0]:
-                band_counts[zone][f'Below {bands[0]}'] += 1
-            elif value > bands[-1]:
-                band_counts[zone][f'Above {bands[-1]}'] += 1
-            else:
-                for i in range(len(bands) - 1):
-                    if bands[i] <= value < bands[i + 1]:
-                        band_counts[zone][f'{bands[i]}-{bands[i + 1]}'] += 1
+    rules = eprules.parse_rules(fail_thresholds)
+    key = ('band table', filter_key(start_dates, end_dates, time_range, day_range, temp_threshold, expression),
+           parameter, tuple(selected_zones), tuple(bands), rules, live)
+    cached = tables.get(key)
+    if cached is not None:
+        return cached
+
+    band_labels = epengine.band_labels(bands)
+    rule_labels = [eprules.rule_label(rule) for rule in rules]
+
+    if live:
+        # Same counts as the graph (the count cube when it applies); fails follow on release
+        counts = zone_band_counts(parameter, selected_zones, bands, start_dates, end_dates, time_range, day_range, temp_threshold, expression, live=True)
+        band_counts = {zone: dict(zip(band_labels, counts[z].tolist())) for z, zone in enumerate(selected_zones)}
+        zone_failures = {zone: {label: '' for label in rule_labels} for zone in selected_zones}
+    else:
+        # Band counts and every fail rule for every zone in one batch
+        result = rule_results(parameter, selected_zones, rules, start_dates, end_dates, time_range, day_range, temp_threshold, expression, bands)
+        band_counts = {zone: dict(zip(band_labels, result['band_counts'][z].tolist())) for z, zone in enumerate(selected_zones)}
+        zone_failures = {zone: {} for zone in selected_zones}  # Stores separate statuses per threshold
 
         # Independent Fail Threshold Check
-        for direction, threshold, max_hours in fail_checks:
-            if col_name not in df_filtered.columns:
-                continue  # Skip missing columns safely
-            
-            if direction == "above":
-                hours_above_threshold = df_filtered[col_name].gt(threshold).sum()
-                print(f"Zone: {zone} | Hours > {threshold}: {hours_above_threshold} (Limit: {max_hours})")
-                zone_failures[zone][f'Fail > {threshold}'] = "Fail" if hours_above_threshold > max_hours else "Pass"
-            elif direction == "below":
-                hours_below_threshold = df_filtered[col_name].lt(threshold).sum()
-                print(f"Zone: {zone} | Hours < {threshold}: {hours_below_threshold} (Limit: {max_hours})")
-                zone_failures[zone][f'Fail < {threshold}'] = "Fail" if hours_below_threshold > max_hours else "Pass"
+        for z, zone in enumerate(selected_zones):
+            if not result['present'][z]:
+                print(f"Warning: No match found for zone '{zone}' and parameter '{parameter}' in dataset.")
+                continue  # Skip this zone if no match found
+            for r, rule in enumerate(rules):
+                symbol = '<' if rule.kind == "below" else '>'
+                print(f"Zone: {zone} | {eprules.MEASURES[rule.measure]} {symbol} {rule.threshold}: {result['hours'][z, r]} (Limit: {rule.hours})")
+                zone_failures[zone][rule_labels[r]] = "Fail" if result['fail'][z, r] else "Pass"
 
     # Create table data
     table_data = [{'Zone': zone, **counts, **zone_failures[zone]} for zone, counts in band_counts.items()]
     columns = [{'name': 'Zone', 'id': 'Zone'}] + [{'name': band, 'id': band} for band in band_labels] + \
-              [{'name': f'Fail {"<" if direction == "below" else ">"} {threshold}','id': f'Fail {"<" if direction == "below" else ">"} {threshold}'} 
-               for direction, threshold, _ in fail_checks]
+              [{'name': label, 'id': label} for label in rule_labels]
               # Calculate totals for each band column
     totals_row = {'Zone': 'Total'}
     for band in band_labels:
         totals_row[band] = sum(row[band] for row in table_data)
     
     # Leave Fail columns empty or summarize fails
-    for direction, threshold, _ in fail_checks:
-        fail_col = f'Fail {"<" if direction == "below" else ">"} {threshold}'
+    for fail_col in rule_labels:
         totals_row[fail_col] = ''  # Could summarize total failures if needed
     
     # Append totals row to the data
     table_data.append(totals_row)
-    return table_data, columns
+    return tables.put(key, (table_data, columns))
 
 
-@app.callback(
-    Output('fail-summary-table', 'data'),
-    Output('fail-summary-table', 'columns'),
-    [Input('parameter-dropdown', 'value'),
-     Input('zone-checklist', 'value'),
-     Input('fail-thresholds', 'value'),
-     Input({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
-     Input({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
-     Input('time-slider', 'value'),
-     Input('day-slider', 'value'),
-     Input('temp-filter', 'value')] 
-)
-def update_fail_summary_table(parameter, selected_zones, fail_thresholds, start_dates, end_dates, time_range, day_range, temp_threshold):
-    if df.empty or not parameter or not selected_zones or not fail_thresholds:
+def update_fail_summary_table(parameter, selected_zones, fail_thresholds, start_dates, end_dates, time_range, day_range, temp_threshold, expression):
+    if dataset is None or not parameter or not selected_zones or not fail_thresholds:
         return [], []
 
-    df_filtered = df.copy()
-    if temp_threshold is None:
-        temp_threshold = 10  # Default to 10°C
-    #print("Available columns:", df_filtered.columns.tolist())
-    if 'Environment [1] Site Outdoor Air Drybulb Temperature  (C)' in df_filtered.columns:
-    # Convert everything to string first, remove quotes, then convert to float
-        df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] = pd.to_numeric(
-            df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'].astype(str).str.replace('"', '', regex=False),
-            errors='coerce'
-        )
-    
-        # Print debug info
-        #print("Temperature values after conversion:", df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'].head(10).tolist())
-    
-        # Apply filtering
-        df_filtered = df_filtered[df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] >= temp_threshold]
-    
-        #print(f"Filtered DataFrame size: {df_filtered.shape}")  # Debugging
-    df_filtered['Day_of_Week'] = df_filtered['Datetime'].dt.dayofweek
-    start_day, end_day = day_range
-    df_filtered = df_filtered[(df_filtered['Day_of_Week'] >= start_day) &
-                              (df_filtered['Day_of_Week'] <= end_day)]
-    
-    # Adjust for New Zealand Daylight Savings Time (NZDT)
-    def is_daylight_savings(date):
-        if date.month < 4 or date.month > 9:
-            return True  # Daylight savings is active
-        return False  # Standard time
-    
-    df_filtered['Adjusted_Hour'] = df_filtered['Datetime'].apply(
-        lambda dt: dt.hour - 1 if is_daylight_savings(dt) else dt.hour
-    )
-    
-    # Filter by Date
-    if any(start_dates) and any(end_dates):
-        filtered_frames = []
-        for start_date, end_date in zip(start_dates, end_dates):
-            if start_date and end_date:
-                mask = (df_filtered['Datetime'].dt.date >= pd.to_datetime(start_date).date()) & \
-                       (df_filtered['Datetime'].dt.date <= pd.to_datetime(end_date).date())
-                filtered_frames.append(df_filtered[mask])
-    
-        if filtered_frames:
-            df_filtered = pd.concat(filtered_frames)
-    
-    # Filter by Adjusted Time
-    start_hour, end_hour = time_range
-    df_filtered = df_filtered[(df_filtered['Adjusted_Hour'] >= start_hour) & 
-                              (df_filtered['Adjusted_Hour'] <= end_hour)]
-    
- 
-    fail_checks = []
-    try:
-        for pair in fail_thresholds.split(','):
-            parts = [p.strip() for p in pair.split(':')]  # Clean input by removing spaces
-    
-            if len(parts) == 2:
-                value, hours = parts
-    
-                # Ensure both values are numeric
-                if value.replace('.', '', 1).lstrip('-').isdigit() and hours.isdigit():
-                    fail_checks.append(("above", float(value), int(hours)))
-                else:
-                    print(f"Skipping invalid threshold entry: {pair}")  # Debugging
-    
-            elif len(parts) == 3:
-                direction, value, hours = parts
-                direction = direction.lower().strip()
-    
-                # Validate direction and numerical values
-                if direction in ["above", "below"] and value.replace('.', '', 1).lstrip('-').isdigit() and hours.isdigit():
-                    fail_checks.append((direction, float(value), int(hours)))
-                else:
-                    print(f"Skipping invalid threshold entry: {pair}")  # Debugging
-    
-            else:
-                print(f"Unexpected format in fail thresholds: {pair}")  # Debugging
-    
-    except Exception as e:
-        print(f"Error parsing fail thresholds: {e}")
-        fail_checks = []  # Prevent breaking the app
-    
+    # Hours above/below every threshold for all zones in one batch (run rules are not hours outside range)
+    rules = tuple(rule for rule in eprules.parse_rules(fail_thresholds) if rule.measure == 'hours')
+    key = ('fail summary', filter_key(start_dates, end_dates, time_range, day_range, temp_threshold, expression),
+           parameter, tuple(selected_zones), rules)
+    cached = tables.get(key)
+    if cached is not None:
+        return cached
 
+    result = rule_results(parameter, selected_zones, rules, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
 
-    
     fail_summary = []
-    for zone in selected_zones:
-        matching_cols = [col for col in df_filtered.columns if zone in col and parameter in col]
-        if not matching_cols:
+    for z, zone in enumerate(selected_zones):
+        if not result['present'][z]:
             continue
-        
-        col_name = matching_cols[0]
-        total_hours = len(df_filtered)
+
+        total_hours = int(result['count'][z] + result['nan_count'][z])  # Every filtered hour
         above_fail_hours = 0
         below_fail_hours = 0
         
-        for direction, threshold, max_hours in fail_checks:
-            if direction == "above":
-                above_fail_hours = df_filtered[col_name].gt(threshold).sum()
-            elif direction == "below":
-                below_fail_hours = df_filtered[col_name].lt(threshold).sum()
+        for r, rule in enumerate(rules):  # The last rule of each direction is reported
+            if rule.kind == "above":
+                above_fail_hours = int(result['hours'][z, r])
+            elif rule.kind == "below":
+                below_fail_hours = int(result['hours'][z, r])
         
         total_fail_hours = above_fail_hours + below_fail_hours  # ✅ Add both together
 
@@ -584,7 +377,7 @@ def update_fail_summary_table(parameter, selected_zones, fail_thresholds, start_
     {'name': 'Percentage Outside Range (%)', 'id': 'Percentage Outside Range (%)'}
 ]
     
-    return fail_summary, columns
+    return tables.put(key, (fail_summary, columns))
 
 app.layout.children.append(
     html.Div([
@@ -612,149 +405,83 @@ app.layout.children.append(
 )
 
 
+def selected_preset():
+    """The library preset picked by the example button or preset dropdown that triggered the callback, or None."""
+    ctx = dash.callback_context  # Get which button was clicked
+    if not ctx.triggered:
+        return None  # Do nothing if no button was clicked
+
+    component_id = ctx.triggered[0]['prop_id'].split('.')[0]
+    if component_id == 'preset-dropdown':
+        name = ctx.triggered[0]['value']
+    elif component_id.startswith(('bands-example-btn-', 'thresholds-example-btn-')):
+        name = PRESET_BUTTONS[int(component_id.rsplit('-', 1)[1]) - 1]
+    else:
+        return None
+    return rule_library.get(name)
+
 @app.callback(
     Output('bands-input', 'value'),
     [Input('bands-example-btn-1', 'n_clicks'),
      Input('bands-example-btn-2', 'n_clicks'),
-     Input('bands-example-btn-3', 'n_clicks')],
+     Input('bands-example-btn-3', 'n_clicks'),
+     Input('preset-dropdown', 'value')],
     prevent_initial_call=True
 )
 
-def set_bands_example(n1, n2, n3):
-    ctx = dash.callback_context  # Get which button was clicked
-    if not ctx.triggered:
-        return dash.no_update  # Do nothing if no button was clicked
-
-    button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-
-    if button_id == 'bands-example-btn-1':
-        return "-1,1"  # Example 1
-    elif button_id == 'bands-example-btn-2':
-        return "18,19,22,25,30"  # Example 2
-    elif button_id == 'bands-example-btn-3':
-        return "600,800,1000,2000"  # Example 3
+def set_bands_example(n1, n2, n3, preset_name):
+    preset = selected_preset()
+    if preset is None or not preset['bands']:
+        return dash.no_update
+    return preset['bands']
 
-    return dash.no_update
 @app.callback(
     Output('fail-thresholds', 'value'),
     [Input('thresholds-example-btn-1', 'n_clicks'),
      Input('thresholds-example-btn-2', 'n_clicks'),
-     Input('thresholds-example-btn-3', 'n_clicks')],
+     Input('thresholds-example-btn-3', 'n_clicks'),
+     Input('preset-dropdown', 'value')],
     prevent_initial_call=True
 )
-def set_thresholds_example(n1, n2, n3):
-    ctx = dash.callback_context  # Get which button was clicked
-    if not ctx.triggered:
-        return dash.no_update  # Do nothing if no button was clicked
-
-    button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-
-    if button_id == 'thresholds-example-btn-1':
-        return "above:1:20,below:-1:20"  # Example 1
-    elif button_id == 'thresholds-example-btn-2':
-        return "25:80,28:40"  # Example 2
-    elif button_id == 'thresholds-example-btn-3':
-        return "800:1,2000:1"  # Example 3
+def set_thresholds_example(n1, n2, n3, preset_name):
+    preset = selected_preset()
+    if preset is None:
+        return dash.no_update
+    return preset['thresholds']
 
-    return dash.no_update
 
-
-@app.callback(
-    Output('average-summary-table', 'data'),
-    Output('average-summary-table', 'columns'),
-    [Input('parameter-dropdown', 'value'),
-     Input('zone-checklist', 'value'),
-     Input('fail-thresholds', 'value'),
-     Input({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
-     Input({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
-     Input('time-slider', 'value'),
-     Input('day-slider', 'value'),
-     Input('temp-filter', 'value')] 
-)
-def update_average_summary_table(parameter, selected_zones, fail_thresholds, start_dates, end_dates, time_range, day_range, temp_threshold):
-    if df.empty or not parameter or not selected_zones or not fail_thresholds:
+def update_average_summary_table(parameter, selected_zones, fail_thresholds, start_dates, end_dates, time_range, day_range, temp_threshold, expression):
+    if dataset is None or not parameter or not selected_zones or not fail_thresholds:
         return [], []
 
-    df_filtered = df.copy()
-    df_filtered['Day_of_Week'] = df_filtered['Datetime'].dt.dayofweek
-    start_day, end_day = day_range
-    df_filtered = df_filtered[(df_filtered['Day_of_Week'] >= start_day) & (df_filtered['Day_of_Week'] <= end_day)]
-    if temp_threshold is None:
-        temp_threshold = 10  # Default to 10°C
-    #print("Available columns:", df_filtered.columns.tolist())
-    if 'Environment [1] Site Outdoor Air Drybulb Temperature  (C)' in df_filtered.columns:
-    # Convert everything to string first, remove quotes, then convert to float
-        df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] = pd.to_numeric(
-            df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'].astype(str).str.replace('"', '', regex=False),
-            errors='coerce'
-        )
-    
-        # Print debug info
-        #print("Temperature values after conversion:", df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'].head(10).tolist())
-    
-        # Apply filtering
-        df_filtered = df_filtered[df_filtered['Environment [1] Site Outdoor Air Drybulb Temperature  (C)'] >= temp_threshold]
-    
-        #print(f"Filtered DataFrame size: {df_filtered.shape}")  # Debugging
-    def is_daylight_savings(date):
-        return date.month < 4 or date.month > 9  # NZDT Adjustment
-
-    df_filtered['Adjusted_Hour'] = df_filtered['Datetime'].apply(lambda dt: dt.hour - 1 if is_daylight_savings(dt) else dt.hour)
-    
-    if any(start_dates) and any(end_dates):
-        filtered_frames = []
-        for start_date, end_date in zip(start_dates, end_dates):
-            if start_date and end_date:
-                mask = (df_filtered['Datetime'].dt.date >= pd.to_datetime(start_date).date()) & \
-                       (df_filtered['Datetime'].dt.date <= pd.to_datetime(end_date).date())
-                filtered_frames.append(df_filtered[mask])
-    
-        if filtered_frames:
-            df_filtered = pd.concat(filtered_frames)
-    
-    start_hour, end_hour = time_range
-    df_filtered = df_filtered[(df_filtered['Adjusted_Hour'] >= start_hour) & (df_filtered['Adjusted_Hour'] <= end_hour)]
-    
-    fail_checks = []
-    peak_threshold = None  # NEW: Only one peak threshold is needed
-    
-    try:
-        for pair in fail_thresholds.split(','):
-            parts = [p.strip() for p in pair.split(':')]
-            
-            if len(parts) == 2 and parts[0].replace('.', '', 1).isdigit() and parts[1] == '1':
-                # This is a PEAK threshold (e.g., "2000:1" means no value should exceed 2000)
-                peak_threshold = float(parts[0])
-    
-            elif len(parts) == 2 and parts[0].replace('.', '', 1).isdigit() and parts[1].isdigit():
-                # This is an AVERAGE threshold (e.g., "800:1" means average must not exceed 800)
-                fail_checks.append(("above_avg", float(parts[0]), int(parts[1])))
-    
-    except Exception as e:
-        print(f"Error parsing fail thresholds: {e}")
-        fail_checks = []
-        peak_threshold = None
+    # "T:1" is a peak limit, any other "T:H" an average limit (see eprules.average_rules)
+    average_thresholds, peak_threshold = eprules.average_rules(eprules.parse_rules(fail_thresholds))
+    key = ('average summary', filter_key(start_dates, end_dates, time_range, day_range, temp_threshold, expression),
+           parameter, tuple(selected_zones), tuple(average_thresholds), peak_threshold)
+    cached = tables.get(key)
+    if cached is not None:
+        return cached
 
+    index = sorted_values(parameter, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    stats = epengine.zone_stats(index, selected_zones)
+    as_data = dataset['values'].dtype.type  # Compare in the data's own precision, like the fail summary
 
-    
     avg_summary = []
-    for zone in selected_zones:
-        matching_cols = [col for col in df_filtered.columns if zone in col and parameter in col]
-        if not matching_cols:
+    for z, zone in enumerate(selected_zones):
+        if not stats['present'][z]:
             continue
-        
-        col_name = matching_cols[0]
-        avg_value = df_filtered[col_name].mean(skipna=True)
-        max_value = df_filtered[col_name].max(skipna=True)  # Check peak value
+
+        avg_value = stats['mean'][z]
+        max_value = stats['max'][z]  # Check peak value
         status = "Pass"
         
         # Check against AVERAGE thresholds
-        for direction, threshold, _ in fail_checks:
-            if direction == "above_avg" and avg_value > threshold:
+        for threshold in average_thresholds:
+            if as_data(avg_value) > as_data(threshold):
                 status = f"Fail (Avg Exceeds {threshold})"
         
         # Check against PEAK threshold
-        if peak_threshold is not None and max_value > peak_threshold:
+        if peak_threshold is not None and as_data(max_value) > as_data(peak_threshold):
             if "Fail" in status:
                 status += f", Peak Exceeds {peak_threshold}"
             else:
@@ -767,15 +494,6 @@ def update_average_summary_table(parameter, selected_zones, fail_thresholds, sta
             'Peak Value': round(max_value, 2) if not pd.isna(max_value) else 'N/A',  # NEW: Add Peak Value Column
             'Status': status
         })
-
-        
-
-        
-        avg_summary.append({
-            'Zone': zone,
-            'Average Value': round(avg_value, 2) if not pd.isna(avg_value) else 'N/A',
-            'Status': status
-        })
     
     columns = [
         {'name': 'Zone', 'id': 'Zone'},
@@ -784,7 +502,110 @@ def update_average_summary_table(parameter, selected_zones, fail_thresholds, sta
         {'name': 'Status', 'id': 'Status'}
     ]
     
-    return avg_summary, columns
+    return tables.put(key, (avg_summary, columns))
+
+LIVE_PROPS = {'time-slider.drag_value', 'day-slider.drag_value'}  # Inputs that fire continuously while dragging
+
+def content_hash(value):
+    """Hash of an output's JSON, to tell whether the browser already shows it."""
+    return hashlib.sha1(to_json_plotly(value).encode('utf-8')).hexdigest()
+
+def figure_patch(fig, zones_changed=True):
+    """A Patch that turns a band figure with the same traces into fig: new y arrays and title,
+    plus the x arrays when the zone selection changed."""
+    patch = dash.Patch()
+    for i, trace in enumerate(fig.data):
+        if zones_changed:
+            patch['data'][i]['x'] = list(trace.x)
+        patch['data'][i]['y'] = epfigure.typed_array(trace.y, np.int32)
+    patch['layout']['title']['text'] = fig.layout.title.text
+    return patch
+
+@app.callback(
+    [Output('data-graph', 'figure'),
+     Output('data-table', 'data'),
+     Output('data-table', 'columns'),
+     Output('fail-summary-table', 'data'),
+     Output('fail-summary-table', 'columns'),
+     Output('average-summary-table', 'data'),
+     Output('average-summary-table', 'columns'),
+     Output('total-hours-display', 'children'),
+     Output('output-hashes', 'data')],
+    [Input('dataset-id', 'data'),
+     Input('parameter-dropdown', 'value'),
+     Input('zone-checklist', 'value'),
+     Input('bands-input', 'value'),
+     Input('fail-thresholds', 'value'),
+     Input({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
+     Input({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
+     Input('time-slider', 'value'),
+     Input('time-slider', 'drag_value'),  # drag_value: update live while the slider moves
+     Input('day-slider', 'value'),
+     Input('day-slider', 'drag_value'),
+     Input('temp-filter', 'value'),
+     Input('filter-expression', 'value')],
+    State('output-hashes', 'data')
+)
+def update_outputs(dataset_id, parameter, selected_zones, bands, fail_thresholds, start_dates, end_dates,
+                   time_range, time_drag, day_range, day_drag, temp_threshold, expression, hashes):
+    """Computes the graph, the three tables and the total hours together, once per interaction.
+
+    While a slider is dragged only the graph and the band table's counts follow it, both from the
+    count cube when it applies; the fail columns and the rest update on release.
+    Outputs whose content hash matches what the browser already has are sent as no_update, and a
+    graph whose bands are unchanged is sent as a Patch of its y arrays and title (x too when the zones changed).
+    """
+    triggered = triggered_props()
+    dragging = bool(triggered) and triggered <= LIVE_PROPS
+
+    outputs = {
+        'data-graph': update_graph(parameter, selected_zones, bands, start_dates, end_dates, time_drag, day_drag,
+                                   temp_threshold, expression, time_range, day_range),
+        'data-table': update_table(parameter, selected_zones, bands, fail_thresholds, start_dates, end_dates,
+                                   time_drag, day_drag, temp_threshold, expression, time_range, day_range,
+                                   live=dragging),
+    }
+    if not dragging:
+        outputs['fail-summary-table'] = update_fail_summary_table(parameter, selected_zones, fail_thresholds, start_dates, end_dates,
+                                                                  time_range, day_range, temp_threshold, expression)
+        outputs['average-summary-table'] = update_average_summary_table(parameter, selected_zones, fail_thresholds, start_dates, end_dates,
+                                                                        time_range, day_range, temp_threshold, expression)
+        outputs['total-hours-display'] = update_total_hours(dataset_id, start_dates, end_dates, time_range, day_range,
+                                                            temp_threshold, expression)
+
+    # Only send what changed
+    hashes = dict(hashes or {})
+    sent = {}
+    for name, value in outputs.items():
+        digest = content_hash(value)
+        if hashes.get(name) != digest:
+            hashes[name] = digest
+            sent[name] = value
+
+    # Same band traces as the browser's figure: patch the arrays instead of rebuilding the figure
+    if 'data-graph' in sent:
+        traces = [trace.name for trace in sent['data-graph'].data]
+        zones = list(sent['data-graph'].data[0].x) if traces else []
+        if traces and hashes.get('data-graph-traces') == traces:
+            sent['data-graph'] = figure_patch(sent['data-graph'], hashes.get('data-graph-zones') != zones)
+        else:
+            epfigure.log_payload('Band graph', sent['data-graph'])
+        hashes['data-graph-traces'] = traces
+        hashes['data-graph-zones'] = zones
+    if epfigure.LOG_PAYLOADS:
+        print(f"Sending {', '.join(sent) or 'nothing'}; unchanged: {', '.join(set(outputs) - set(sent)) or 'none'}")
+
+    def pick(name, part=None):
+        if name not in sent:
+            return dash.no_update
+        return sent[name] if part is None else sent[name][part]
+
+    return (pick('data-graph'),
+            pick('data-table', 0), pick('data-table', 1),
+            pick('fail-summary-table', 0), pick('fail-summary-table', 1),
+            pick('average-summary-table', 0), pick('average-summary-table', 1),
+            pick('total-hours-display'),
+            hashes if sent else dash.no_update)
 
 app.layout.children.append(
     html.Div([
@@ -805,6 +626,326 @@ app.layout.children.append(
 )
 
 
+app.layout.children.append(
+    html.Div([
+        html.Label("Threshold Sweep (format: start:stop:step, e.g. 20:32:0.5)"),
+        dcc.Input(id='sweep-range', type='text', value='20:32:0.5'),
+        dcc.RadioItems(
+            id='sweep-direction',
+            options=[
+                {'label': 'Hours Above', 'value': 'above'},
+                {'label': 'Hours Below', 'value': 'below'}
+            ],
+            value='above',
+            inline=True
+        ),
+        dcc.RadioItems(
+            id='sweep-view',
+            options=[
+                {'label': 'Heatmap', 'value': 'heatmap'},
+                {'label': 'Lines', 'value': 'lines'}
+            ],
+            value='heatmap',
+            inline=True
+        ),
+        dcc.Graph(id='sweep-graph'),
+        dcc.Store(id='sweep-data'),  # Sweep table ({'data', 'columns'}) for the export textbox
+        html.Button("Copy to textbox", id="copy-sweep-btn", n_clicks=0),
+        dcc.Textarea(id="clipboard-sweep", style={'width': '100%', 'height': '200px'})
+    ])
+)
+
+
+@app.callback(
+    Output('sweep-graph', 'figure'),
+    Output('sweep-data', 'data'),
+    [Input('parameter-dropdown', 'value'),
+     Input('zone-checklist', 'value'),
+     Input('sweep-range', 'value'),
+     Input('sweep-direction', 'value'),
+     Input('sweep-view', 'value'),
+     Input({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
+     Input({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
+     Input('time-slider', 'value'),
+     Input('day-slider', 'value'),
+     Input('temp-filter', 'value'),
+     Input('filter-expression', 'value')]
+)
+def update_sweep(parameter, selected_zones, sweep_range, direction, view, start_dates, end_dates, time_range, day_range, temp_threshold, expression):
+    """Exceedance curves: hours above (or below) every swept threshold for every zone."""
+    if dataset is None or not parameter or not selected_zones:
+        return go.Figure(), None
+
+    thresholds = eprules.parse_sweep(sweep_range)
+    if not thresholds:
+        return go.Figure(), None
+
+    # The whole sweep is one rule set: thresholds x zones in a single batch
+    index = sorted_values(parameter, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    result = eprules.evaluate_rules(index, selected_zones, eprules.sweep_rules(thresholds, direction))
+    zones = [zone for z, zone in enumerate(selected_zones) if result['present'][z]]
+    hours = result['hours'][result['present']]
+
+    symbol = '<' if direction == 'below' else '>'
+    fig = go.Figure()
+    if view == 'lines':
+        for z, zone in enumerate(zones):
+            fig.add_trace(go.Scatter(x=thresholds, y=hours[z].astype(np.int32), mode='lines', name=zone))
+        fig.update_layout(yaxis_title=f'Hours {symbol} Threshold')
+    else:
+        fig.add_trace(go.Heatmap(z=hours.astype(np.int32), x=thresholds, y=zones, colorscale='Viridis',
+                                 colorbar=dict(title='Hours')))
+        fig.update_layout(yaxis_title='Zones')
+    fig.update_layout(
+        title=f'{parameter} Hours {symbol} Threshold',
+        xaxis_title='Threshold'
+    )
+
+    labels = [f'{symbol} {t}' for t in thresholds]
+    sweep_table = {
+        'data': [{'Zone': zone, **dict(zip(labels, hours[z].tolist()))} for z, zone in enumerate(zones)],
+        'columns': [{'name': 'Zone', 'id': 'Zone'}] + [{'name': label, 'id': label} for label in labels]
+    }
+    epfigure.log_payload('Sweep graph', fig)
+    return fig, sweep_table
+
+
+app.layout.children.append(
+    html.Div([
+        html.Button("Compliance Overview", id='compliance-btn', n_clicks=0),
+        dash_table.DataTable(
+            id='compliance-table',
+            columns=[],
+            data=[],
+
+            editable=False,
+            style_table={'overflowX': 'auto'},
+            style_data={'whiteSpace': 'normal', 'height': 'auto'}
+        ),
+        html.Button("Copy to textbox", id="copy-compliance-btn", n_clicks=0),
+        dcc.Textarea(id="clipboard-compliance", style={'width': '100%', 'height': '200px'})
+    ])
+)
+
+
+@app.callback(
+    Output('compliance-table', 'data'),
+    Output('compliance-table', 'columns'),
+    Input('compliance-btn', 'n_clicks'),
+    [State('zone-checklist', 'value'),
+     State({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
+     State({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
+     State('time-slider', 'value'),
+     State('day-slider', 'value'),
+     State('temp-filter', 'value'),
+     State('filter-expression', 'value')],
+    prevent_initial_call=True
+)
+def update_compliance_overview(n_clicks, selected_zones, start_dates, end_dates, time_range, day_range, temp_threshold, expression):
+    """Pass/fail of every library preset for every zone under the current filters.
+
+    "T:1" rules are peak limits, as in the average summary (see eprules.peak_rules).
+    """
+    if dataset is None or not selected_zones:
+        return [], []
+
+    # Group the presets by the parameter they apply to, so each parameter is evaluated once
+    groups = {}
+    for name, preset in rule_library.items():
+        parameter = eprules.preset_parameter(preset, dataset['parameters'])
+        if parameter is None:
+            print(f"Preset '{name}': no '{preset['parameter']}' parameter in dataset")  # Debugging
+            continue
+        groups.setdefault(parameter, []).append((name, eprules.parse_rules(preset['thresholds'])))
+
+    statuses = {zone: {name: 'N/A' for name in rule_library} for zone in selected_zones}
+    for parameter, presets in groups.items():
+        # All presets of a parameter are one rule set: one batch over its sorted values
+        rules = eprules.peak_rules(rule for _, preset_rules in presets for rule in preset_rules)
+        result = rule_results(parameter, selected_zones, rules, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+
+        start = 0
+        for name, preset_rules in presets:
+            fail = result['fail'][:, start:start + len(preset_rules)]
+            for z, zone in enumerate(selected_zones):
+                if not result['present'][z]:
+                    continue
+                failed = [('Peak ' if eprules.is_peak_rule(rule) else '') + eprules.rule_text(rule)
+                          for r, rule in enumerate(preset_rules) if fail[z, r]]
+                statuses[zone][name] = f"Fail ({', '.join(failed)})" if failed else "Pass"
+            start += len(preset_rules)
+
+    table_data = [{'Zone': zone, **statuses[zone]} for zone in selected_zones]
+    columns = [{'name': 'Zone', 'id': 'Zone'}] + [{'name': name, 'id': name} for name in rule_library]
+    return table_data, columns
+
+
+app.layout.children.append(
+    html.Div([
+        html.Label('Joint Condition (e.g. "Air Temperature" > 25 and CO2 > 1000)'),
+        dcc.Input(id='joint-condition', type='text', debounce=True, style={'width': '60%'}),
+        dash_table.DataTable(
+            id='joint-table',
+            columns=[],
+            data=[],
+
+            editable=False,
+            style_table={'overflowX': 'auto'},
+            style_data={'whiteSpace': 'normal', 'height': 'auto'}
+        ),
+        html.Button("Copy to textbox", id="copy-joint-btn", n_clicks=0),
+        dcc.Textarea(id="clipboard-joint", style={'width': '100%', 'height': '200px'})
+    ])
+)
+
+
+@app.callback(
+    Output('joint-table', 'data'),
+    Output('joint-table', 'columns'),
+    [Input('joint-condition', 'value'),
+     Input('zone-checklist', 'value'),
+     Input({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
+     Input({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
+     Input('time-slider', 'value'),
+     Input('day-slider', 'value'),
+     Input('temp-filter', 'value'),
+     Input('filter-expression', 'value')]
+)
+def update_joint_table(condition, selected_zones, start_dates, end_dates, time_range, day_range, temp_threshold, expression):
+    """Hours per zone where a condition over several parameters of the same zone holds (see epexpr)."""
+    if dataset is None or not selected_zones or not condition:
+        return [], []
+
+    try:
+        tree = epexpr.parse(condition)
+        parameters = {name: epdata.find_parameter(dataset['parameters'], name) for name in epexpr.names(tree)}
+    except ValueError as e:
+        print("Error in joint condition:", str(e))
+        return [], []
+
+    # One filtered timesteps x zones matrix per parameter, evaluated together
+    _, rows = epfilter.row_filter(dataset, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    matrices = {name: epdata.zone_matrix(dataset, selected_zones, parameter, rows) for name, parameter in parameters.items()}
+    try:
+        met = epexpr.evaluate(tree, matrices.__getitem__)
+    except ValueError as e:
+        print("Error in joint condition:", str(e))
+        return [], []
+
+    # Zones missing any of the parameters are left out
+    present = np.all([epdata.zone_columns(dataset, selected_zones, parameter) >= 0
+                      for parameter in parameters.values()], axis=0)
+    hours = met.sum(axis=0)
+    total_hours = len(rows)
+
+    table_data = [{
+        'Zone': zone,
+        'Hours Meeting Condition': int(hours[z]),
+        'Percentage of Hours (%)': round(hours[z] / total_hours * 100, 2) if total_hours > 0 else 0
+    } for z, zone in enumerate(selected_zones) if present[z]]
+    columns = [
+        {'name': 'Zone', 'id': 'Zone'},
+        {'name': 'Hours Meeting Condition', 'id': 'Hours Meeting Condition'},
+        {'name': 'Percentage of Hours (%)', 'id': 'Percentage of Hours (%)'}
+    ]
+    return table_data, columns
+
+
+TIMESERIES_BUCKETS = 1000  # Min/max buckets per zone of the time-series view (about one per pixel)
+MAX_TIMESERIES_POINTS = 40000  # Points per time-series response over all zones
+
+app.layout.children.append(
+    html.Div([
+        html.Label("Hourly Time Series (zoom to load full detail)"),
+        dcc.Graph(id='timeseries-graph'),
+        dcc.Store(id='timeseries-window')  # [start, end] of the last x-axis zoom, None for an open end
+    ])
+)
+
+
+def zoom_window(relayout):
+    """The (start, end) timestamps of a relayoutData x-axis zoom, (None, None) for the full series,
+    or None when the event did not change the x-axis."""
+    if not relayout:
+        return None, None
+    if relayout.get('xaxis.autorange'):
+        return None, None
+    if 'xaxis.range[0]' in relayout:
+        start, end = relayout['xaxis.range[0]'], relayout.get('xaxis.range[1]')
+    elif 'xaxis.range' in relayout:
+        start, end = relayout['xaxis.range']
+    else:
+        return None
+    try:
+        return pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64()
+    except (TypeError, ValueError):
+        print(f"Unreadable zoom range: {start} to {end}")  # Debugging
+        return None, None
+
+
+@app.callback(
+    Output('timeseries-graph', 'figure'),
+    Output('timeseries-window', 'data'),
+    [Input('timeseries-graph', 'relayoutData'),
+     Input('parameter-dropdown', 'value'),
+     Input('zone-checklist', 'value'),
+     Input({'type': 'date-picker-range', 'index': ALL}, 'start_date'),
+     Input({'type': 'date-picker-range', 'index': ALL}, 'end_date'),
+     Input('time-slider', 'value'),
+     Input('day-slider', 'value'),
+     Input('temp-filter', 'value'),
+     Input('filter-expression', 'value')],
+    State('timeseries-window', 'data')
+)
+def update_timeseries(relayout, parameter, selected_zones, start_dates, end_dates, time_range, day_range, temp_threshold, expression, last_window):
+    """Hourly readings of the selected zones, decimated to min/max buckets of the visible time window.
+
+    Every zoom asks the server for the visible window again, so the response holds at most
+    MAX_TIMESERIES_POINTS points at any zoom level. Hours the filters drop are gaps in the lines.
+    Zone and filter changes redraw the last zoomed window; a new parameter starts zoomed out.
+    """
+    if dataset is None or not parameter or not selected_zones:
+        return go.Figure(), dash.no_update
+
+    if triggered_by('timeseries-graph'):
+        window = zoom_window(relayout)
+        if window is None:  # Autosize, pan mode changes, y-axis zooms and the like keep the drawn series
+            return dash.no_update, dash.no_update
+    elif triggered_by('parameter-dropdown') or not last_window:
+        window = (None, None)
+    else:
+        window = tuple(last_window)
+    stored = [None if t is None else str(t) for t in window]
+
+    zones = [zone for zone, col in zip(selected_zones, epdata.zone_columns(dataset, selected_zones, parameter))
+             if col >= 0]
+    if not zones:
+        return go.Figure(), stored
+
+    mask, _ = epfilter.row_filter(dataset, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    start, stop = epengine.time_window(dataset, *window)
+    timeline = epengine.zone_timeline(dataset, mask, zones, parameter, (start, stop))
+    buckets = max(1, min(TIMESERIES_BUCKETS, MAX_TIMESERIES_POINTS // (2 * len(zones))))
+    rows, values = epengine.decimate_minmax(timeline, buckets)
+
+    # Dates as float64 milliseconds and readings as float32, both sent as typed arrays (see epfigure)
+    stamps = dataset['sorted_timestamps'][start:stop].astype('datetime64[ms]').astype(np.int64).astype(np.float64)
+    fig = go.Figure()
+    for z, zone in enumerate(zones):
+        fig.add_trace(go.Scattergl(x=stamps[rows[:, z]], y=values[:, z].astype(np.float32),
+                                   mode='lines', name=zone))
+    fig.update_layout(
+        title=f'{parameter} by Hour',
+        xaxis=dict(type='date', title='Time'),
+        yaxis_title=parameter,
+        uirevision=parameter  # Keep the zoom while filters and zones change
+    )
+    if epfigure.LOG_PAYLOADS:
+        print(f"Time series: {stop - start} hours x {len(zones)} zones drawn as {values.size} points")
+    epfigure.log_payload('Time series graph', fig)
+    return fig, stored
+
+
 #import pyperclip  # Needed for clipboard functionality
 
 def format_table_for_clipboard(table_data, table_columns):
@@ -863,6 +1004,42 @@ def copy_avg_to_clipboard(n_clicks, table_data, table_columns):
     #pyperclip.copy(formatted_data)  # Copy to system clipboard
     return formatted_data
 
+@app.callback(
+    Output("clipboard-compliance", "value"),
+    Input("copy-compliance-btn", "n_clicks"),
+    State("compliance-table", "data"),
+    State("compliance-table", "columns"),
+    prevent_initial_call=True
+)
+def copy_compliance_to_clipboard(n_clicks, table_data, table_columns):
+    """Copies the compliance overview to clipboard."""
+    return format_table_for_clipboard(table_data, table_columns)
+
+
+@app.callback(
+    Output("clipboard-joint", "value"),
+    Input("copy-joint-btn", "n_clicks"),
+    State("joint-table", "data"),
+    State("joint-table", "columns"),
+    prevent_initial_call=True
+)
+def copy_joint_to_clipboard(n_clicks, table_data, table_columns):
+    """Copies the joint condition table to clipboard."""
+    return format_table_for_clipboard(table_data, table_columns)
+
+
+@app.callback(
+    Output("clipboard-sweep", "value"),
+    Input("copy-sweep-btn", "n_clicks"),
+    State("sweep-data", "data"),
+    prevent_initial_call=True
+)
+def copy_sweep_to_clipboard(n_clicks, sweep_table):
+    """Copies the threshold sweep (zones x thresholds) to clipboard."""
+    if not sweep_table:
+        return ""
+    return format_table_for_clipboard(sweep_table['data'], sweep_table['columns'])
+
 import sys
 
 # Default port
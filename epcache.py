@@ -0,0 +1,152 @@
+"""Disk cache of parsed uploads, keyed by a hash of the uploaded bytes.
+
+Each entry is one uncompressed .npz file holding named typed arrays plus a
+small JSON header: either the matrix of a parsed dataset, or the columns of a
+parsed frame (numeric as-is, datetimes as int64, text as fixed-width unicode). Loading an entry is a handful of memory copies instead
+of a CSV parse. Entries are evicted least-recently-used once the cache directory
+grows past CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.environ.get(
+    'EP_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.parsed_cache')
+)
+CACHE_MAX_BYTES = int(os.environ.get('EP_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # 512 MB default
+FORMAT_VERSION = 1  # Bump when the on-disk layout changes
+
+_META_KEY = '__meta__'
+
+
+def digest(data):
+    """Returns the hex hash used to address uploads."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def content_key(kind, upload_digest, version=1):
+    """Builds a cache key from the kind of parse, its version and the hash of the upload bytes."""
+    return f'{kind}-v{version}-f{FORMAT_VERSION}-{upload_digest}'
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key + '.npz')
+
+
+def save_arrays(key, arrays, meta=None):
+    """Stores named numpy arrays plus a JSON-able meta dict under key, then enforces the byte budget.
+
+    The cache is best effort: a failed write is printed and cleaned up, never raised.
+    """
+    tmp_path = None
+    try:
+        arrays = dict(arrays)
+        arrays[_META_KEY] = np.frombuffer(json.dumps(meta or {}).encode('utf-8'), dtype=np.uint8)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temp file first so a crash never leaves a half-written entry behind
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, _entry_path(key))
+        tmp_path = None
+        evict(CACHE_MAX_BYTES)
+    except Exception as e:  # Any failure only costs the cache entry, never the upload
+        print("Error writing parse cache:", str(e))
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def load_arrays(key):
+    """Returns (arrays dict, meta) for a cached key, or None on a miss."""
+    path = _entry_path(key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        os.utime(path)  # Mark as recently used for LRU eviction
+    except (OSError, ValueError, KeyError) as e:
+        print("Error reading parse cache:", str(e))
+        return None
+
+    meta = json.loads(arrays.pop(_META_KEY).tobytes().decode('utf-8'))
+    return arrays, meta
+
+
+def save_frame(key, frame, meta=None):
+    """Stores a frame's typed columns under key."""
+    arrays = {}
+    columns = []
+    for i, col in enumerate(frame.columns):
+        series = frame[col]
+        name = f'c{i}'
+        if pd.api.types.is_datetime64_any_dtype(series):
+            kind = 'datetime'
+            arrays[name] = series.to_numpy(dtype='datetime64[ns]').view('int64')
+        elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            kind = 'numeric'
+            arrays[name] = series.to_numpy()
+        else:
+            kind = 'text'
+            arrays[name] = series.astype(str).to_numpy(dtype=str)
+            arrays[name + '_null'] = series.isna().to_numpy()
+        columns.append({'name': str(col), 'kind': kind})
+
+    save_arrays(key, arrays, {'columns': columns, 'meta': meta or {}})
+
+
+def load_frame(key):
+    """Returns (frame, meta) for a key stored with save_frame, or None on a miss."""
+    cached = load_arrays(key)
+    if cached is None:
+        return None
+
+    arrays, header = cached
+    data = {}
+    for i, col in enumerate(header['columns']):
+        values = arrays[f'c{i}']
+        if col['kind'] == 'datetime':
+            values = values.view('datetime64[ns]')
+        elif col['kind'] == 'text':
+            values = pd.Series(values, dtype=object).mask(arrays[f'c{i}_null'])
+        data[col['name']] = values
+
+    frame = pd.DataFrame(data, columns=[col['name'] for col in header['columns']])
+    return frame, header['meta']
+
+
+def evict(max_bytes):
+    """Deletes least-recently-used entries until the cache fits in max_bytes."""
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith('.npz'):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):  # Oldest first
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,355 @@
+"""Parsed-dataset layer for the DesignBuilder analyzers.
+
+An upload is parsed once into a dataset and kept in memory, keyed by a hash of
+the uploaded bytes. Callbacks look the dataset up by id instead of re-reading
+the CSV every time an input changes. Parsed columns are also written to the
+epcache disk cache, so re-uploading the same export skips the CSV parse.
+
+Uploads are never decoded in one go: the base64 payload is decoded a block at
+a time and parsed in row chunks straight into a preallocated numeric array, so
+peak memory stays close to the size of the parsed values.
+
+A dataset is a dict holding one column-major float32 matrix of timesteps x
+series ('values') plus integer index arrays: the zone and parameter code of
+every series and the calendar fields of every timestep. Analysis code takes
+views of the matrix rather than copying frames.
+"""
+import base64
+import calendar
+import csv
+import hashlib
+import io
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+import epcache
+
+MAX_DATASETS = 4  # Parsed uploads kept in memory (oldest dropped first)
+PARSE_VERSION = 3  # Bump when the parsed output changes, to invalidate the disk cache
+DATASET_DTYPE = np.dtype(os.environ.get('EP_DATASET_DTYPE', 'float32'))  # float32 or float64
+DECODE_BLOCK_CHARS = 4 * 256 * 1024  # base64 characters decoded per block (multiple of 4)
+CHUNK_ROWS = 4096  # CSV rows parsed per chunk
+DATETIME_FORMAT = '%b %d %I:%M %p'
+TRACE_INGEST_MEMORY = os.environ.get('EP_TRACE_INGEST_MEMORY', '0') == '1'  # tracemalloc, about 2x slower ingest
+
+# Daylight saving: EnergyPlus reports in standard time and the exports carry no year
+# (they parse as 1900), so the timezone's rule is applied in a reference year with the
+# same calendar as the parsed one. Its transitions then fall on the dataset's own Sundays.
+TIMEZONE = os.environ.get('EP_TIMEZONE', 'Pacific/Auckland')
+DST_REFERENCE_YEAR = int(os.environ.get('EP_DST_REFERENCE_YEAR', 2023))  # Search for a matching year starts here
+
+_datasets = {}  # dataset id -> dataset dict
+
+
+class Base64Reader(io.RawIOBase):
+    """Read-only file object that base64-decodes a payload string one block at a time."""
+
+    def __init__(self, payload, block_chars=DECODE_BLOCK_CHARS):
+        self._payload = payload
+        self._block_chars = block_chars
+        self._pos = 0
+        self._buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not len(self._buffer) and self._pos < len(self._payload):
+            block = self._payload[self._pos:self._pos + self._block_chars]
+            self._pos += len(block)
+            self._buffer = memoryview(base64.b64decode(block))
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def scan_upload(payload):
+    """Decodes a base64 payload block by block and returns (sha1 hex digest, line count)."""
+    digest = hashlib.sha1()
+    lines = 0
+    last = b'\n'
+    for start in range(0, len(payload), DECODE_BLOCK_CHARS):
+        block = base64.b64decode(payload[start:start + DECODE_BLOCK_CHARS])
+        if block:
+            digest.update(block)
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1  # Last line has no trailing newline
+    return digest.hexdigest(), lines
+
+
+def stream_designbuilder_csv(payload, line_count, chunk_rows=CHUNK_ROWS, dtype=DATASET_DTYPE):
+    """Parses a base64 DesignBuilder export (two title rows, parameter row, zone row, data) into arrays.
+
+    Returns (values, timestamps, param_names, zone_names, stats) where stats holds the
+    row count, elapsed time, throughput and size of the preallocated arrays of the ingest,
+    plus its peak traced memory when EP_TRACE_INGEST_MEMORY=1.
+    """
+    started = time.perf_counter()
+    tracing = TRACE_INGEST_MEMORY and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+
+    text = io.TextIOWrapper(io.BufferedReader(Base64Reader(payload), buffer_size=1024 * 1024),
+                            encoding='utf-8', newline='')
+    try:
+        # Two title rows, then the parameter names and zone names
+        for _ in range(2):
+            text.readline()
+        param_row, zone_row = csv.reader([text.readline(), text.readline()])
+        param_names = param_row[1:]
+        zone_names = zone_row[1:]
+        n_series = min(len(param_names), len(zone_names))
+        param_names, zone_names = param_names[:n_series], zone_names[:n_series]
+
+        # Every remaining line is at most one row, so this never has to grow.
+        # Column-major so that each series is one contiguous block.
+        capacity = max(line_count - 4, 0)
+        values = np.empty((capacity, n_series), dtype=dtype, order='F')
+        stamps = np.empty(capacity, dtype='datetime64[ns]')
+        n_rows = 0
+
+        reader = pd.read_csv(text, header=None, chunksize=chunk_rows, dtype={0: str},
+                             names=range(n_series + 1))
+        for chunk in reader:
+            when = pd.to_datetime(chunk[0].str[7:], format=DATETIME_FORMAT, errors='coerce')
+            valid = when.notna().to_numpy()
+            numbers = chunk.iloc[:, 1:]
+            if (numbers.dtypes == object).any():
+                # Columns with stray text (e.g. quoted numbers) go through to_numeric, per chunk only
+                numbers = numbers.apply(
+                    lambda s: pd.to_numeric(s, errors='coerce') if s.dtype == object else s)
+
+            m = int(valid.sum())
+            if n_rows + m > capacity:  # Only reachable if line counting was off; grow
+                capacity = max(2 * capacity, n_rows + m)
+                grown = np.empty((capacity, n_series), dtype=dtype, order='F')
+                grown[:n_rows] = values[:n_rows]
+                values = grown
+                stamps = np.concatenate([stamps[:n_rows], np.empty(capacity - n_rows, dtype=stamps.dtype)])
+            values[n_rows:n_rows + m] = numbers.to_numpy(dtype=dtype)[valid]
+            stamps[n_rows:n_rows + m] = when.to_numpy()[valid]
+            n_rows += m
+    finally:
+        text.close()
+
+    array_mb = (values.nbytes + stamps.nbytes) / 1e6  # The bulk of the ingest's memory
+    # Row slices of a column-major array keep every series contiguous, so no copy is needed
+    values = values[:n_rows]
+    stamps = stamps[:n_rows]
+
+    seconds = time.perf_counter() - started
+    size_mb = len(payload) * 3 / 4 / 1e6
+    stats = {
+        'rows': n_rows,
+        'series': n_series,
+        'seconds': round(seconds, 3),
+        'mb_per_s': round(size_mb / seconds, 1) if seconds > 0 else None,
+        'array_mb': round(array_mb, 1),
+        'peak_mb': None,
+    }
+    if tracing:
+        stats['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+        tracemalloc.stop()
+    print(f"Ingested {n_rows} rows x {n_series} series ({size_mb:.1f} MB) in {stats['seconds']}s, "
+          f"{stats['mb_per_s']} MB/s, arrays {stats['array_mb']} MB"
+          + (f", peak traced memory {stats['peak_mb']} MB" if tracing else ''))
+    return values, stamps, param_names, zone_names, stats
+
+
+def reference_year(year, start=DST_REFERENCE_YEAR):
+    """The first year from start with the same calendar as year (weekday of 1 January and leap day)."""
+    for candidate in range(start, start + 28):  # The calendar repeats within 28 years
+        if calendar.isleap(candidate) == calendar.isleap(year) and \
+                datetime(candidate, 1, 1).weekday() == datetime(year, 1, 1).weekday():
+            return candidate
+    return start
+
+
+def dst_flags(day_of_year, hour, timezone=TIMEZONE, year=DST_REFERENCE_YEAR):
+    """Returns the DST offset in hours (1 while DST is in effect, else 0) at each standard-time day of year and hour, as int8.
+
+    The pairs are placed in the given year, moved to UTC with the zone's standard
+    offset and converted back to local wall time; the difference is the DST offset.
+    Pass a year with the dataset's calendar (see reference_year) so transitions land on its Sundays.
+    """
+    tz = ZoneInfo(timezone)
+    new_year = datetime(year, 1, 1)
+    standard_offset = tz.utcoffset(new_year) - tz.dst(new_year)
+
+    standard = np.datetime64(f'{year}-01-01T00', 'h') + \
+        (day_of_year.astype(np.int64) - 1) * 24 + hour.astype(np.int64)
+    standard = pd.DatetimeIndex(standard.astype('datetime64[ns]'))
+    wall = (standard - standard_offset).tz_localize('UTC').tz_convert(tz).tz_localize(None)
+    return ((wall - standard) // pd.Timedelta(hours=1)).to_numpy(dtype=np.int8)
+
+
+def calendar_bitmaps(field, count, first=0):
+    """Packs one bitmap per value of a small integer field (e.g. 24 hours) into a (count, n/8) uint8 array."""
+    return np.packbits(field[None, :] == np.arange(first, first + count)[:, None], axis=1)
+
+
+def build_dataset(dataset_id, values, timestamps, param_names, zone_names):
+    """Builds the dataset dict (matrix, series names, index maps, calendar arrays) from parsed arrays."""
+    zones = list(dict.fromkeys(zone_names))  # File order, one entry per zone
+    parameters = list(dict.fromkeys(param_names))
+    zone_codes = {zone: i for i, zone in enumerate(zones)}
+    param_codes = {param: i for i, param in enumerate(parameters)}
+
+    series_names = [f'{zone} {param}'.strip() for zone, param in zip(zone_names, param_names)]
+    when = pd.DatetimeIndex(timestamps)
+    hour = when.hour.to_numpy(dtype=np.int8)
+    day_of_year = when.dayofyear.to_numpy(dtype=np.int16)
+    year = reference_year(int(when.year[0])) if len(when) else DST_REFERENCE_YEAR
+    dst = dst_flags(day_of_year, hour, year=year)
+    # Local wall-clock hour: standard time plus the DST offset (the day fields stay on standard time)
+    local_hour = ((hour + dst) % 24).astype(np.int8)
+    day_of_week = when.dayofweek.to_numpy(dtype=np.int8)
+    month = when.month.to_numpy(dtype=np.int8)
+    time_order = None
+    if len(timestamps) > 1 and (timestamps[1:] < timestamps[:-1]).any():
+        time_order = np.argsort(timestamps, kind='stable')
+    return {
+        'id': dataset_id,
+        'values': values,
+        'timestamps': timestamps,
+        'series_names': series_names,
+        'series_lookup': {name: i for i, name in enumerate(series_names)},
+        'zones': zones,
+        'parameters': parameters,
+        # Exact (zone, parameter) -> column lookup from the two header rows
+        'column_index': {(zone, param): i for i, (zone, param) in enumerate(zip(zone_names, param_names))},
+        'series_zone': np.array([zone_codes[z] for z in zone_names], dtype=np.int32),
+        'series_param': np.array([param_codes[p] for p in param_names], dtype=np.int32),
+        # Calendar fields of each timestep, computed once
+        'hour': hour,
+        'local_hour': local_hour,  # Wall-clock hour with daylight saving, 0-23
+        'dst': dst,
+        'day_of_week': day_of_week,  # Monday = 0, Sunday = 6
+        'month': month,
+        'day_of_year': day_of_year,
+        'date': timestamps.astype('datetime64[D]'),
+        # Packed per-value bitmaps (bit i set = timestep i has that value) for fast slider masks
+        'hour_bitmaps': calendar_bitmaps(local_hour, 24),
+        'day_bitmaps': calendar_bitmaps(day_of_week, 7),
+        'month_bitmaps': calendar_bitmaps(month, 12, first=1),
+        # Sorted view of the timestamps for binary searches; time_order is None when already sorted
+        'sorted_timestamps': timestamps if time_order is None else timestamps[time_order],
+        'time_order': time_order,
+    }
+
+
+def load_dataset(contents):
+    """Returns the dataset for a dcc.Upload payload, parsing it only if it is not already loaded."""
+    content_type, content_string = contents.split(',')
+    dataset_id, line_count = scan_upload(content_string)
+
+    if dataset_id in _datasets:
+        return _datasets[dataset_id]
+
+    cache_key = epcache.content_key('designbuilder', dataset_id, PARSE_VERSION)
+    cached = epcache.load_arrays(cache_key)
+    stats = None
+    if cached is not None and cached[0]['values'].dtype == DATASET_DTYPE:
+        arrays, meta = cached
+        values, timestamps = arrays['values'], arrays['timestamps'].view('datetime64[ns]')
+        param_names, zone_names = meta['param_names'], meta['zone_names']
+    else:
+        values, timestamps, param_names, zone_names, stats = stream_designbuilder_csv(content_string, line_count)
+        epcache.save_arrays(cache_key, {'values': values, 'timestamps': timestamps.view('int64')},
+                            {'param_names': param_names, 'zone_names': zone_names})
+
+    dataset = build_dataset(dataset_id, values, timestamps, param_names, zone_names)
+    dataset['ingest_stats'] = stats
+
+    while len(_datasets) >= MAX_DATASETS:
+        _datasets.pop(next(iter(_datasets)))
+    _datasets[dataset_id] = dataset
+    return dataset
+
+
+def get_dataset(dataset_id):
+    """Returns a loaded dataset by id, or None if it is not (or no longer) in memory."""
+    if not dataset_id:
+        return None
+    return _datasets.get(dataset_id)
+
+
+def series(dataset, name):
+    """Returns a zero-copy view of one series by its column name, or None if it is not in the dataset."""
+    col = dataset['series_lookup'].get(name)
+    if col is None:
+        return None
+    return dataset['values'][:, col]
+
+
+def zone_column(dataset, zone, parameter):
+    """Returns the column of a zone's parameter series, or None if the export has no such series."""
+    return dataset['column_index'].get((zone, parameter))
+
+
+def zone_columns(dataset, zones, parameter):
+    """Returns the columns of a parameter for several zones as an int array, -1 where a zone has none."""
+    index = dataset['column_index']
+    return np.array([index.get((zone, parameter), -1) for zone in zones], dtype=np.intp)
+
+
+def zone_matrix(dataset, zones, parameter, rows):
+    """Returns the given rows of a parameter as a timesteps x zones array, NaN for zones without that series."""
+    cols = zone_columns(dataset, zones, parameter)
+    present = cols >= 0
+    matrix = np.full((len(rows), len(zones)), np.nan, dtype=dataset['values'].dtype)
+    matrix[:, present] = dataset['values'][np.ix_(rows, cols[present])]
+    return matrix
+
+
+def dataset_frame(dataset):
+    """Returns the dataset as a wide frame (Datetime, one column per series, Date) for the older apps.
+
+    The older apps compare readings in float64, so the columns are float64. float32 readings are
+    widened through their shortest decimal text, so 18.3 stays 18.3 (not 18.299999237) and a
+    reading on a band edge stays on it. Built once and kept on the dataset.
+    """
+    if 'frame' not in dataset:
+        values = dataset['values']
+        if values.dtype != np.float64:
+            values = np.asfortranarray(values.astype(str).astype(np.float64))
+        df = pd.DataFrame(values, columns=dataset['series_names'], copy=False)
+        df.insert(0, 'Datetime', dataset['timestamps'])
+        df['Date'] = df['Datetime'].dt.date  # Extract the date without time
+        dataset['frame'] = df
+    return dataset['frame']
+
+
+def filter_zones(zones, filter_word, filter_mode):
+    """Applies the include/exclude word filter to a list of zone names."""
+    if not filter_word:
+        return list(zones)
+
+    filter_word = filter_word.lower().strip()  # Normalize input
+    if filter_mode == 'exclude':
+        return [z for z in zones if filter_word not in z.lower()]  # Remove matching zones
+    elif filter_mode == 'include':
+        return [z for z in zones if filter_word in z.lower()]  # Keep only matching zones
+    return list(zones)
+
+
+def find_parameter(parameters, name):
+    """Returns the parameter called name, else the only one containing it (case-insensitive). Raises ValueError otherwise."""
+    if name in parameters:
+        return name
+    matches = [p for p in parameters if name.lower() in p.lower()]
+    if len(matches) == 1:
+        return matches[0]
+    if not matches:
+        raise ValueError(f"No parameter matches '{name}'")
+    raise ValueError(f"'{name}' matches several parameters: {', '.join(matches)}")
@@ -0,0 +1,416 @@
+"""Vectorized counting engine for the energyplus band and threshold analyses.
+
+Functions here take a 2-D array of filtered timesteps x zones (one column per
+selected zone, NaN where a reading is missing) and reduce it in a single numpy
+pass instead of looping over values in Python.
+
+Band edge semantics: bands are half-open intervals [lower, upper). With sorted
+edges b0 < b1 < ... < bn a value v is counted in
+    'Below b0'        if v < b0
+    'bi-bi+1'         if bi <= v < bi+1
+    'Above bn'        if v >= bn
+so every non-missing value lands in exactly one band. (The old per-value loop
+dropped values exactly equal to the top edge.)
+
+For slider-only interactions a count cube (zone x band x month x day of week x
+hour, prefix-summed over the hour axis) answers band counts for any hour, day
+and month window without touching the timestep rows.
+
+For band and threshold edits a sorted-value index (each zone's filtered values
+sorted once per filter state) turns "hours below / between / above" into
+searchsorted differences, so retyping bands or thresholds costs O(zones log n).
+After each filter change a background thread builds the indexes of the other
+parameters too, as many as fit half of the index memory budget (EP_SORTED_CACHE_MB),
+so switching parameters is usually answered from memory.
+
+The time-series view draws at most a fixed number of min/max buckets per zone
+for the visible time window (decimate_minmax), so its payload stays bounded at
+any zoom level.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+import epdata
+import epfilter
+import epstage
+
+MAX_CUBES = 4  # Count cubes kept in memory
+MAX_SORTED = 64  # Sorted-value indexes kept in memory
+MAX_SORTED_BYTES = int(os.environ.get('EP_SORTED_CACHE_MB', 512)) * 2**20  # Memory for sorted-value indexes
+MAX_STATS = 64  # Zone statistics kept in memory
+
+# Cached stages (see epstage); each key starts with the key of the stage it reads from
+_cubes = epstage.Stage('count cube', MAX_CUBES)  # (dataset id, parameter, bands, temperature) -> cube dict
+_sorted = epstage.Stage('sorted values', MAX_SORTED, MAX_SORTED_BYTES,
+                        lambda index: index['values'].nbytes)  # (filter key, parameter) -> sorted-value index
+_stats = epstage.Stage('zone stats', MAX_STATS)  # (sorted key, zones, bands, thresholds, above) -> stats
+_warm_lock = threading.Lock()
+_warming = {'key': None}  # Filter key the background warm-up is working on
+
+
+def parse_bands(text):
+    """Parses the bands input ("18,21,30") into a sorted list of edges, skipping (and printing) invalid entries.
+
+    The input is not debounced, so half-typed text ("18,-") must not raise.
+    """
+    if not text:
+        return []
+    bands = []
+    for entry in text.split(','):
+        if not entry.strip():
+            continue  # Ignore empty values
+        try:
+            value = float(entry)
+        except ValueError:
+            print(f"Skipping invalid band entry: {entry}")  # Debugging
+            continue
+        if not np.isfinite(value):
+            print(f"Skipping invalid band entry: {entry}")  # Debugging
+            continue
+        bands.append(value)
+    bands.sort()
+    return bands
+
+
+def band_labels(bands):
+    """Returns the column labels for sorted band edges: 'Below x', 'a-b', ..., 'Above y'."""
+    return [f'Below {bands[0]}'] + [f'{bands[i]}-{bands[i+1]}' for i in range(len(bands)-1)] + [f'Above {bands[-1]}']
+
+
+def build_count_cube(values, cols, bands, month, day_of_week, hour, keep):
+    """Counts readings per zone x band x month x day of week x hour, prefix-summed over the hour axis.
+
+    values is the timesteps x series matrix and cols the series of each zone; keep masks
+    out rows (e.g. the outdoor temperature filter).
+    Returns an int32 array of shape (zones, bands, 12, 7, 24) where [..., h] counts hours 0..h.
+    """
+    n_zones = len(cols)
+    n_bands = len(bands) + 1
+    n_cells = 12 * 7 * 24
+    edges = np.asarray(bands, dtype=values.dtype)
+    calendar = (((month.astype(np.int64) - 1) * 7 + day_of_week) * 24 + hour)[keep]
+
+    cube = np.empty((n_zones, n_bands * n_cells), dtype=np.int32)
+    for z, col in enumerate(cols):  # One series at a time keeps temporaries small
+        column = values[keep, col]
+        valid = ~np.isnan(column)
+        band = np.searchsorted(edges, column[valid], side='right')
+        cube[z] = np.bincount(band * n_cells + calendar[valid], minlength=n_bands * n_cells)
+
+    cube = cube.reshape(n_zones, n_bands, 12, 7, 24)
+    return np.cumsum(cube, axis=-1, dtype=np.int32)
+
+
+def count_cube(dataset, parameter, bands, temp_threshold, build=True):
+    """Returns the memoized count cube of a parameter over every zone that has it, for the given bands and temperature filter.
+
+    The result is a dict with 'cube' and 'zone_rows' (zone name -> first axis index).
+    With build=False a cube that is not already in memory is not built and None is returned.
+    """
+    if temp_threshold is None:
+        temp_threshold = epfilter.DEFAULT_TEMP_THRESHOLD
+    key = (dataset['id'], parameter, tuple(bands), float(temp_threshold))
+    if not build:
+        return _cubes.get(key)
+
+    def build_entry():
+        zones = [zone for zone in dataset['zones'] if epdata.zone_column(dataset, zone, parameter) is not None]
+        cols = epdata.zone_columns(dataset, zones, parameter)
+        started = time.perf_counter()
+        cube = build_count_cube(dataset['values'], cols, bands, dataset['month'], dataset['day_of_week'],
+                                dataset['local_hour'], epfilter.temperature_mask(dataset, temp_threshold))
+        print(f"Built count cube for '{parameter}' ({len(zones)} zones, {cube.nbytes / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - started:.2f}s")
+        return {'cube': cube, 'zone_rows': {zone: i for i, zone in enumerate(zones)}}
+
+    return _cubes.compute(key, build_entry)
+
+
+def cube_band_counts(entry, zones, time_range, day_range, months=None):
+    """Band counts (zones x bands) for an hour window, day window and optional months, read from a count cube."""
+    cube = entry['cube']
+    start_hour, end_hour = time_range if time_range else (0, 23)
+    start_day, end_day = day_range if day_range else (0, 6)
+
+    window = cube[..., end_hour]
+    if start_hour > 0:
+        window = window - cube[..., start_hour - 1]
+    window = window[:, :, :, start_day:end_day + 1]
+    if months is not None:
+        window = window[:, :, [m - 1 for m in months]]
+    per_zone = window.sum(axis=(2, 3))
+
+    # Zones without the parameter count nothing
+    counts = np.zeros((len(zones), cube.shape[1]), dtype=np.int64)
+    for z, zone in enumerate(zones):
+        row = entry['zone_rows'].get(zone)
+        if row is not None:
+            counts[z] = per_zone[row]
+    return counts
+
+
+def sorted_index(dataset, filter_key, rows, parameter):
+    """Returns the memoized sorted values of a parameter for every zone that has it, over the filtered rows.
+
+    The result is a dict with 'values' (rows x zones, each column ascending with NaNs last),
+    'valid' (non-missing count per zone), 'sum' (float64 per zone), 'zone_rows' (zone name -> column)
+    and 'key', the stage key downstream stages build on.
+    """
+    key = (filter_key, parameter)
+
+    def build():
+        zones = [zone for zone in dataset['zones'] if epdata.zone_column(dataset, zone, parameter) is not None]
+        cols = epdata.zone_columns(dataset, zones, parameter)
+        values = np.sort(dataset['values'][np.ix_(rows, cols)], axis=0)  # NaN sorts to the end
+        return {
+            'values': values,
+            'valid': (~np.isnan(values)).sum(axis=0),
+            'sum': np.nansum(values, axis=0, dtype=np.float64),
+            'zone_rows': {zone: i for i, zone in enumerate(zones)},
+            'key': key,
+        }
+
+    return _sorted.compute(key, build)
+
+
+def warm_sorted_indexes(dataset, filter_key, rows):
+    """Starts building the sorted-value indexes of the other parameters for a filter state in a background thread.
+
+    Parameters are warmed in dataset order while they fit in half of MAX_SORTED_BYTES (and half of
+    MAX_SORTED), leaving the rest for the indexes of other filter states. A newer filter state stops
+    an unfinished warm-up; the indexes of an old state are keyed by its filter key, so they are never
+    served for a different one.
+    """
+    with _warm_lock:
+        if _warming['key'] == filter_key:
+            return
+        _warming['key'] = filter_key
+    threading.Thread(target=_warm_sorted_indexes, args=(dataset, filter_key, rows), daemon=True).start()
+
+
+def warm_parameters(dataset, rows):
+    """The parameters whose sorted-value indexes fit the warm-up budget, in dataset order."""
+    itemsize = dataset['values'].dtype.itemsize
+    budget = MAX_SORTED_BYTES // 2
+    parameters = []
+    for parameter in dataset['parameters'][:MAX_SORTED // 2]:
+        n_zones = int((epdata.zone_columns(dataset, dataset['zones'], parameter) >= 0).sum())
+        budget -= len(rows) * n_zones * itemsize
+        if budget < 0:
+            break
+        parameters.append(parameter)
+    return parameters
+
+
+def _warm_sorted_indexes(dataset, filter_key, rows):
+    started = time.perf_counter()
+    parameters = warm_parameters(dataset, rows)
+    for parameter in parameters:
+        if _warming['key'] != filter_key:
+            print(f"Stopped warming sorted indexes for {filter_key}: filters changed")
+            return
+        sorted_index(dataset, filter_key, rows, parameter)
+    print(f"Warmed sorted indexes of {len(parameters)} of {len(dataset['parameters'])} parameters "
+          f"in {time.perf_counter() - started:.2f}s (budget {MAX_SORTED_BYTES // 2 // 2**20} MB)")
+
+
+def zone_stats(index, zones, bands=(), thresholds=(), above=()):
+    """Every per-zone aggregate the graph and tables use, in one walk over the zones of a sorted-value index.
+
+    Memoized by the index's key and the other arguments; the arrays are read-only.
+
+    Each zone's sorted column gives count, min and max directly, and a single searchsorted
+    call places all band edges and thresholds. Returns a dict of arrays following zones:
+        'present'              zone has the parameter
+        'count', 'nan_count'   non-missing and missing readings
+        'sum', 'min', 'max', 'mean'   float64, NaN when the zone has no readings
+        'band_counts'          zones x (len(bands) + 1) ordered like band_labels, half-open bands (see the module docstring)
+        'exceed'               zones x thresholds, hours > t where above else hours < t
+    """
+    key = (index['key'], tuple(zones), tuple(bands), tuple(thresholds), tuple(above))
+    return _stats.compute(key, lambda: _zone_stats(index, zones, bands, thresholds, above))
+
+
+def _zone_stats(index, zones, bands, thresholds, above):
+    values = index['values']
+    n_zones = len(zones)
+    n_bands = len(bands)
+    above = np.asarray(above, dtype=bool)
+    # Band edges and thresholds are all "values < x" positions, plus "values <= x" for thresholds above
+    edges = np.concatenate([np.asarray(bands, dtype=values.dtype), np.asarray(thresholds, dtype=values.dtype)])
+
+    stats = {
+        'present': np.zeros(n_zones, dtype=bool),
+        'count': np.zeros(n_zones, dtype=np.int64),
+        'nan_count': np.zeros(n_zones, dtype=np.int64),
+        'sum': np.zeros(n_zones, dtype=np.float64),
+        'min': np.full(n_zones, np.nan),
+        'max': np.full(n_zones, np.nan),
+        'band_counts': np.zeros((n_zones, n_bands + 1), dtype=np.int64),
+        'exceed': np.zeros((n_zones, len(thresholds)), dtype=np.int64),
+    }
+    for z, zone in enumerate(zones):
+        row = index['zone_rows'].get(zone)
+        if row is None:
+            continue
+        count = int(index['valid'][row])
+        column = values[:count, row]  # Ascending, NaNs trimmed
+        stats['present'][z] = True
+        stats['count'][z] = count
+        stats['nan_count'][z] = len(values) - count
+        stats['sum'][z] = index['sum'][row]
+        if count:
+            stats['min'][z] = column[0]
+            stats['max'][z] = column[-1]
+
+        below = np.searchsorted(column, edges, side='left')
+        stats['band_counts'][z] = np.diff(np.concatenate(([0], below[:n_bands], [count])))
+        if len(thresholds):
+            # v > t is everything past the right insertion point; v < t everything before the left one
+            at_or_below = np.searchsorted(column, edges[n_bands:][above], side='right')
+            exceed = below[n_bands:].copy()
+            exceed[above] = count - at_or_below
+            stats['exceed'][z] = exceed
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['mean'] = np.where(stats['count'] > 0, stats['sum'] / stats['count'], np.nan)
+    for array in stats.values():
+        array.flags.writeable = False
+    return stats
+
+
+def zone_timeline(dataset, mask, zones, parameter, window=None):
+    """The readings of a parameter in time order (timesteps x zones), NaN on rows the filter drops so runs break there.
+
+    window, a (start, stop) slice of the time-ordered rows, limits the result to those rows.
+    """
+    order = dataset['time_order']
+    start, stop = window or (0, len(mask))
+    rows = np.arange(start, stop) if order is None else order[start:stop]
+    matrix = epdata.zone_matrix(dataset, zones, parameter, rows)
+    matrix[~mask[rows]] = np.nan
+    return matrix
+
+
+def time_window(dataset, start=None, end=None):
+    """The (start, stop) slice of the time-ordered rows between two timestamps (None for an open end)."""
+    stamps = dataset['sorted_timestamps']
+    lo = 0 if start is None else int(np.searchsorted(stamps, np.datetime64(start, 'ns'), side='left'))
+    hi = len(stamps) if end is None else int(np.searchsorted(stamps, np.datetime64(end, 'ns'), side='right'))
+    return lo, max(lo, hi)
+
+
+def decimate_minmax(timeline, buckets):
+    """Reduces a timesteps x zones timeline to the minimum and maximum of each of at most buckets row buckets.
+
+    Returns (rows, values), both (2 * bucket count) x zones: the row numbers of each bucket's
+    minimum and maximum in time order, and the readings there. Peaks survive decimation, so the
+    drawn line has the same envelope as the full series. Buckets with no readings give NaN
+    (a gap in the line). A timeline with no more than 2 * buckets rows is returned whole.
+    """
+    n_rows, n_zones = timeline.shape
+    if n_rows <= 2 * buckets:
+        return np.repeat(np.arange(n_rows)[:, None], n_zones, axis=1), timeline
+
+    size = -(-n_rows // buckets)  # Rows per bucket, rounded up
+    count = -(-n_rows // size)
+    padded = np.full((count * size, n_zones), np.nan, dtype=timeline.dtype)
+    padded[:n_rows] = timeline
+    missing = np.isnan(padded)
+    blocks = padded.reshape(count, size, n_zones)
+
+    # argmin/argmax over each bucket with NaN pushed out of the way
+    low = np.where(missing, np.inf, padded).reshape(count, size, n_zones).argmin(axis=1)
+    high = np.where(missing, -np.inf, padded).reshape(count, size, n_zones).argmax(axis=1)
+    first, second = np.minimum(low, high), np.maximum(low, high)
+
+    offsets = (np.arange(count) * size)[:, None]
+    rows = np.empty((2 * count, n_zones), dtype=np.intp)
+    rows[0::2] = offsets + first
+    rows[1::2] = offsets + second
+    values = np.empty((2 * count, n_zones), dtype=timeline.dtype)
+    values[0::2] = np.take_along_axis(blocks, first[:, None, :], axis=1)[:, 0]
+    values[1::2] = np.take_along_axis(blocks, second[:, None, :], axis=1)[:, 0]
+    return np.minimum(rows, n_rows - 1), values
+
+
+def run_lengths(condition):
+    """Longest run and number of runs of True in each column of a timesteps x zones boolean array.
+
+    Vectorized run-length encoding: run starts and ends are the +1/-1 steps of the
+    zero-padded columns, paired in order within each zone.
+    """
+    n_rows, n_zones = condition.shape
+    padded = np.zeros((n_zones, n_rows + 2), dtype=np.int8)
+    padded[:, 1:-1] = condition.T
+    steps = np.diff(padded, axis=1)
+    start_zone, start_row = np.nonzero(steps == 1)
+    _, end_row = np.nonzero(steps == -1)
+
+    episodes = np.bincount(start_zone, minlength=n_zones)
+    longest = np.zeros(n_zones, dtype=np.int64)
+    np.maximum.at(longest, start_zone, end_row - start_row)
+    return longest, episodes
+
+
+def legacy_band_counts(values, bands):
+    """The original per-value Python loop, kept for benchmarking against zone_stats."""
+    counts = np.zeros((values.shape[1], len(bands) + 1), dtype=np.int64)
+    for z in range(values.shape[1]):
+        column = values[:, z]
+        for value in column[~np.isnan(column)]:
+            if value < bands[0]:
+                counts[z, 0] += 1
+            elif value > bands[-1]:
+                counts[z, -1] += 1
+            else:
+                for i in range(len(bands) - 1):
+                    if bands[i] <= value < bands[i + 1]:
+                        counts[z, i + 1] += 1
+    return counts
+
+
+def benchmark(n_rows=8760, n_zones=300, bands=(18, 19, 22, 25, 30), legacy_zones=20):
+    """Times the band counts of zone_stats against the old per-value loop on random data and prints the results.
+
+    The sort that builds the sorted-value index is paid once per filter state, so it is timed separately.
+    """
+    rng = np.random.default_rng(0)
+    values = (22 + 4 * rng.standard_normal((n_rows, n_zones))).astype(np.float32)
+    values[rng.random(values.shape) < 0.01] = np.nan
+    bands = sorted(float(b) for b in bands)
+    zones = [f'Zone {z}' for z in range(n_zones)]
+
+    started = time.perf_counter()
+    ordered = np.sort(values, axis=0)
+    index = {'values': ordered, 'valid': (~np.isnan(ordered)).sum(axis=0),
+             'sum': np.nansum(ordered, axis=0, dtype=np.float64),
+             'zone_rows': {zone: z for z, zone in enumerate(zones)}, 'key': ('benchmark',)}
+    sorting = time.perf_counter() - started
+
+    started = time.perf_counter()
+    counts = _zone_stats(index, zones, bands, (), ())['band_counts']  # Unmemoized
+    indexed = time.perf_counter() - started
+
+    # The loop is far too slow to run over every zone; time a subset and scale up
+    started = time.perf_counter()
+    legacy = legacy_band_counts(values[:, :legacy_zones], bands)
+    looped = (time.perf_counter() - started) * n_zones / legacy_zones
+
+    # Both agree everywhere except values exactly on the top edge, which the loop drops
+    on_top = (values[:, :legacy_zones] == np.float32(bands[-1])).sum(axis=0)
+    agree = np.array_equal(counts[:legacy_zones, :-1], legacy[:, :-1]) and \
+        np.array_equal(counts[:legacy_zones, -1], legacy[:, -1] + on_top)
+
+    print(f"{n_rows} rows x {n_zones} zones, {len(bands) + 1} bands")
+    print(f"  loop (estimated): {looped:.2f}s")
+    print(f"  index sort:       {sorting * 1000:.1f}ms (once per filter state)")
+    print(f"  zone_stats:       {indexed * 1000:.1f}ms ({looped / indexed:.0f}x faster)")
+    print(f"  counts agree:     {agree}")
+
+
+if __name__ == '__main__':
+    benchmark()
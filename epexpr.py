@@ -0,0 +1,179 @@
+"""Small boolean expression language compiled to numpy operations.
+
+    expression := term ('or' term)*
+    term       := factor ('and' factor)*
+    factor     := 'not' factor | '(' expression ')' | name op number | name 'in' set | name
+    op         := > | >= | < | <= | == | !=
+    set        := a..b | [item, item, ...]      (item is a number or a..b; ranges include both ends)
+    name       := identifier, or "quoted text" for names with spaces or brackets
+
+For example: "Air Temperature" > 25 and CO2 > 1000
+
+Expressions are parsed once into a tuple tree (memoized by text) and evaluated
+against arrays supplied by a resolver, so the same parser serves any set of
+names. Comparisons are made in the array's own dtype; NaN is never true, so
+"not CO2 > 1000" is false where the CO2 reading is missing, like "CO2 > 1000".
+"""
+import operator
+import re
+from functools import lru_cache
+
+import numpy as np
+
+KEYWORDS = ('and', 'or', 'not', 'in')
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le,
+             '==': operator.eq, '!=': operator.ne}
+
+_TOKEN = re.compile(r'\s*(?:(?P<number>-?\d+(?:\.\d+)?)|(?P<string>"[^"]*")|'
+                    r'(?P<op>\.\.|>=|<=|==|!=|[<>()\[\],])|(?P<name>[A-Za-z_][A-Za-z0-9_]*))')
+
+
+def tokenize(text):
+    """Splits an expression into (kind, value) tokens; kind is number, name, keyword or op."""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Unexpected character at {position}: {text[position:position + 10]!r}")
+        position = match.end()
+        if match.group('number') is not None:
+            tokens.append(('number', float(match.group('number'))))
+        elif match.group('string') is not None:
+            tokens.append(('name', match.group('string')[1:-1]))
+        elif match.group('op') is not None:
+            tokens.append(('op', match.group('op')))
+        elif match.group('name').lower() in KEYWORDS:
+            tokens.append(('keyword', match.group('name').lower()))
+        else:
+            tokens.append(('name', match.group('name')))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent parser producing ('and'|'or', a, b), ('not', a), ('cmp', name, op, value),
+    ('in', name, ((low, high), ...)) and ('name', name) nodes."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind, value=None):
+        token = self.peek()
+        if token[0] != kind or (value is not None and token[1] != value):
+            expected = value or kind
+            raise ValueError(f"Expected {expected} but found {token[1] if token[0] else 'end of expression'}")
+        self.position += 1
+        return token[1]
+
+    def accept(self, kind, value):
+        if self.peek() == (kind, value):
+            self.position += 1
+            return True
+        return False
+
+    def expression(self):
+        node = self.term()
+        while self.accept('keyword', 'or'):
+            node = ('or', node, self.term())
+        return node
+
+    def term(self):
+        node = self.factor()
+        while self.accept('keyword', 'and'):
+            node = ('and', node, self.factor())
+        return node
+
+    def factor(self):
+        if self.accept('keyword', 'not'):
+            return ('not', self.factor())
+        if self.accept('op', '('):
+            node = self.expression()
+            self.take('op', ')')
+            return node
+
+        name = self.take('name')
+        kind, value = self.peek()
+        if kind == 'op' and value in OPERATORS:
+            self.position += 1
+            return ('cmp', name, value, self.take('number'))
+        if self.accept('keyword', 'in'):
+            return ('in', name, self.value_set())
+        return ('name', name)
+
+    def value_set(self):
+        if not self.accept('op', '['):
+            return (self.value_range(),)
+        items = [self.value_range()]
+        while self.accept('op', ','):
+            items.append(self.value_range())
+        self.take('op', ']')
+        return tuple(items)
+
+    def value_range(self):
+        low = self.take('number')
+        high = self.take('number') if self.accept('op', '..') else low
+        return (low, high)
+
+
+@lru_cache(maxsize=64)
+def parse(text):
+    """Parses an expression into its tuple tree. Raises ValueError on a syntax error."""
+    parser = _Parser(tokenize(text or ''))
+    if not parser.tokens:
+        raise ValueError("Empty expression")
+    tree = parser.expression()
+    if parser.position != len(parser.tokens):
+        raise ValueError(f"Unexpected {parser.peek()[1]} after the expression")
+    return tree
+
+
+def names(tree):
+    """The names an expression refers to, in order of first use."""
+    if tree[0] in ('and', 'or'):
+        found = names(tree[1])
+        return found + [name for name in names(tree[2]) if name not in found]
+    if tree[0] == 'not':
+        return names(tree[1])
+    return [tree[1]]
+
+
+def known(tree, resolve):
+    """Boolean array (or True) of where none of the readings an expression refers to is NaN."""
+    present = True
+    for name in names(tree):
+        values = resolve(name)
+        if values.dtype.kind == 'f':
+            present = present & ~np.isnan(values)
+    return present
+
+
+def evaluate(tree, resolve):
+    """Evaluates a parsed expression to a boolean array; resolve(name) returns the array of a name."""
+    kind = tree[0]
+    if kind == 'and':
+        return evaluate(tree[1], resolve) & evaluate(tree[2], resolve)
+    if kind == 'or':
+        return evaluate(tree[1], resolve) | evaluate(tree[2], resolve)
+    if kind == 'not':
+        # Negating "NaN > x" must not make it true: only hours where every reading is present can be
+        return ~evaluate(tree[1], resolve) & known(tree[1], resolve)
+
+    values = resolve(tree[1])
+    if kind == 'name':
+        if values.dtype != bool:
+            raise ValueError(f"'{tree[1]}' is not a condition; compare it with a number")
+        return values
+
+    dtype = values.dtype if values.dtype.kind == 'f' else np.float64
+    with np.errstate(invalid='ignore'):  # NaN compares false
+        if kind == 'cmp':
+            return OPERATORS[tree[2]](values, np.asarray(tree[3], dtype=dtype))
+        inside = np.zeros(values.shape, dtype=bool)
+        for low, high in tree[2]:
+            inside |= (values >= np.asarray(low, dtype=dtype)) & (values <= np.asarray(high, dtype=dtype))
+        return inside
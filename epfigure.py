@@ -0,0 +1,59 @@
+"""Compact figure payloads for the dash apps.
+
+plotly 6 serializes numpy arrays in a figure as base64 typed arrays
+({'dtype': 'i4', 'bdata': ...}), which plotly.js reads straight into a typed
+array instead of parsing a JSON list of numbers. Traces should therefore be
+given numpy arrays in the narrowest dtype that holds them: int32 for counts,
+float32 for readings. Patch operations are serialized as plain JSON, so
+typed_array builds the same encoding by hand for them.
+
+Payload logging serializes a figure twice more, so it is off unless
+EP_LOG_PAYLOADS=1.
+"""
+import base64
+import os
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+LOG_PAYLOADS = os.environ.get('EP_LOG_PAYLOADS', '0') == '1'  # Print payload sizes and sent outputs
+
+
+def typed_array(values, dtype):
+    """Encodes values as a plotly typed array spec, e.g. {'dtype': 'i4', 'bdata': '...'}."""
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    spec = {'dtype': array.dtype.str.lstrip('<|'), 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+    if array.ndim > 1:
+        spec['shape'] = ','.join(str(n) for n in array.shape)
+    return spec
+
+
+def _as_lists(value):
+    """A copy of a figure dict with every numpy array and typed array spec turned into a plain list."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, dict) and 'bdata' in value and 'dtype' in value:
+        array = np.frombuffer(base64.b64decode(value['bdata']), dtype=np.dtype(value['dtype']).newbyteorder('<'))
+        if 'shape' in value:
+            array = array.reshape([int(n) for n in str(value['shape']).split(',')])
+        return array.tolist()
+    if isinstance(value, dict):
+        return {key: _as_lists(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_as_lists(item) for item in value]
+    return value
+
+
+def payload_sizes(figure):
+    """Returns (bytes with typed arrays, bytes with the same arrays as JSON lists) of a figure's JSON."""
+    typed = len(to_json_plotly(figure))
+    as_lists = len(to_json_plotly(_as_lists(figure.to_dict())))
+    return typed, as_lists
+
+
+def log_payload(name, figure):
+    """Prints a figure's payload size with typed arrays against plain JSON lists, when LOG_PAYLOADS is on."""
+    if not LOG_PAYLOADS:
+        return
+    typed, as_lists = payload_sizes(figure)
+    print(f"{name} payload: {typed / 1024:.1f} KB as typed arrays, {as_lists / 1024:.1f} KB as JSON lists")
@@ -0,0 +1,209 @@
+"""Row filters shared by the energyplus callbacks.
+
+The date, hour, day and outdoor temperature inputs are compiled into one
+boolean row mask over a dataset. Masks are memoized by dataset id and filter
+inputs, so the graph and the three tables that all receive the same inputs
+evaluate the filters once per interaction instead of once each.
+
+An optional filter expression (see epexpr) is ANDed in, for row selections the
+sliders cannot express:
+    hour in 9..17 and weekday and outdoor_db >= 10 and month in [12,1,2]
+Its names are the calendar arrays of the dataset (EXPRESSION_NAMES) or any
+series by its full name in quotes. Compiled expression masks are cached by text.
+"""
+import numpy as np
+import pandas as pd
+
+import epdata
+import epexpr
+import epstage
+
+OUTDOOR_DRYBULB_SERIES = 'Environment [1] Site Outdoor Air Drybulb Temperature  (C)'
+DEFAULT_TEMP_THRESHOLD = 10  # °C, used when the temperature input is cleared
+MAX_MASKS = 32  # Filter states kept in the memo
+MAX_EXPRESSIONS = 16  # Compiled filter expressions kept in memory
+
+# Filter expression name -> what it reads from a dataset
+EXPRESSION_NAMES = {
+    'hour': 'daylight-saving adjusted hour, 0-23',
+    'day': 'day of the week, Monday = 0 to Sunday = 6',
+    'weekday': 'Monday to Friday',
+    'weekend': 'Saturday and Sunday',
+    'month': 'month, 1-12',
+    'day_of_year': 'day of the year, 1-366',
+    'dst': 'daylight saving time in effect',
+    'outdoor_db': 'outdoor air drybulb temperature',
+}
+
+_masks = epstage.Stage('mask', MAX_MASKS)  # filter key -> (mask, row numbers)
+_expressions = epstage.Stage('expression', MAX_EXPRESSIONS)  # (dataset id, expression text) -> mask
+
+
+def filter_key(dataset_id, start_dates, end_dates, time_range, day_range, temp_threshold, expression=None):
+    """Normalizes the filter inputs into a hashable memo key."""
+    if temp_threshold is None:
+        temp_threshold = DEFAULT_TEMP_THRESHOLD
+    return (dataset_id,
+            tuple(start_dates or ()), tuple(end_dates or ()),
+            tuple(time_range) if time_range else None,
+            tuple(day_range) if day_range else None,
+            float(temp_threshold),
+            expression_text(expression))
+
+
+def expression_text(expression):
+    """Normalizes a filter expression input; None when there is no expression."""
+    return ' '.join((expression or '').split()) or None
+
+
+def _expression_array(dataset, name):
+    """Resolves a filter expression name to an array over the dataset's timesteps."""
+    key = name.lower()
+    if key == 'hour':
+        return dataset['local_hour']
+    if key == 'day':
+        return dataset['day_of_week']
+    if key == 'weekday':
+        return dataset['day_of_week'] < 5
+    if key == 'weekend':
+        return dataset['day_of_week'] >= 5
+    if key == 'dst':
+        return dataset['dst'] != 0
+    if key in ('month', 'day_of_year'):
+        return dataset[key]
+    if key == 'outdoor_db':
+        name = OUTDOOR_DRYBULB_SERIES
+    values = epdata.series(dataset, name)
+    if values is None:
+        raise ValueError(f"Unknown name '{name}' (use {', '.join(EXPRESSION_NAMES)} or a quoted series name)")
+    return values
+
+
+def expression_mask(dataset, expression):
+    """Returns the memoized, read-only row mask of a filter expression. Raises ValueError if it is invalid."""
+    text = expression_text(expression)
+
+    def build():
+        mask = epexpr.evaluate(epexpr.parse(text), lambda name: _expression_array(dataset, name))
+        mask.flags.writeable = False
+        return mask
+
+    return _expressions.compute((dataset['id'], text), build)
+
+
+def expression_error(dataset, expression):
+    """The reason a filter expression cannot be used, or None when it is valid or empty."""
+    if not expression_text(expression):
+        return None
+    try:
+        expression_mask(dataset, expression)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def calendar_mask(dataset, hours=None, days=None, months=None):
+    """ORs the precomputed bitmaps of the selected hours, days and months and ANDs the three together.
+
+    Each argument is an iterable of values (None = no restriction). Returns a packed uint8 bitmap.
+    """
+    packed = None
+    for bitmaps, selected, first in ((dataset['hour_bitmaps'], hours, 0),
+                                     (dataset['day_bitmaps'], days, 0),
+                                     (dataset['month_bitmaps'], months, 1)):
+        if selected is None:
+            continue
+        index = [v - first for v in selected if 0 <= v - first < len(bitmaps)]
+        field = np.bitwise_or.reduce(bitmaps[index], axis=0) if index else np.zeros_like(bitmaps[0])
+        packed = field if packed is None else packed & field
+    if packed is None:
+        packed = np.full(dataset['hour_bitmaps'].shape[1], 0xFF, dtype=np.uint8)
+    return packed
+
+
+def date_intervals(start_dates, end_dates):
+    """Merges the complete date ranges into sorted, non-overlapping [start, end) datetime64 intervals.
+
+    A range covers whole days, so its end is the midnight after end_date.
+    """
+    intervals = []
+    for start_date, end_date in zip(start_dates or (), end_dates or ()):
+        if start_date and end_date:
+            start = np.datetime64(pd.to_datetime(start_date).date(), 'ns')
+            end = np.datetime64(pd.to_datetime(end_date).date(), 'ns') + np.timedelta64(1, 'D')
+            if end > start:
+                intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)  # Overlapping or touching: extend
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def interval_mask(dataset, intervals):
+    """Marks the rows whose timestamp falls in any of the merged intervals, found by binary search."""
+    timestamps = dataset['sorted_timestamps']
+    starts = np.searchsorted(timestamps, [start for start, _ in intervals], side='left')
+    ends = np.searchsorted(timestamps, [end for _, end in intervals], side='left')
+
+    inside = np.zeros(len(timestamps), dtype=bool)
+    for start, end in zip(starts, ends):
+        inside[start:end] = True  # Intervals are disjoint, so each row is set at most once
+
+    order = dataset['time_order']
+    if order is None:
+        return inside
+    unsorted = np.empty_like(inside)
+    unsorted[order] = inside
+    return unsorted
+
+
+def temperature_mask(dataset, temp_threshold):
+    """Returns the rows whose outdoor drybulb temperature is at least temp_threshold (all rows if not exported)."""
+    if temp_threshold is None:
+        temp_threshold = DEFAULT_TEMP_THRESHOLD
+    outdoor = epdata.series(dataset, OUTDOOR_DRYBULB_SERIES)
+    if outdoor is None:
+        return np.ones(len(dataset['timestamps']), dtype=bool)
+    return outdoor >= temp_threshold
+
+
+def compile_mask(dataset, start_dates, end_dates, time_range, day_range, temp_threshold, expression=None):
+    """Evaluates the outdoor temperature, day, hour, date and expression filters into one boolean row mask."""
+    keep = temperature_mask(dataset, temp_threshold)
+
+    # Day (Monday = 0, Sunday = 6) and daylight-saving adjusted hour filters, from the packed bitmaps
+    hours = range(time_range[0], time_range[1] + 1) if time_range else None
+    days = range(day_range[0], day_range[1] + 1) if day_range else None
+    if hours is not None or days is not None:
+        keep &= np.unpackbits(calendar_mask(dataset, hours=hours, days=days), count=len(keep)).view(bool)
+
+    # Filter by Date: rows inside the union of the complete ranges
+    intervals = date_intervals(start_dates, end_dates)
+    if intervals:
+        keep &= interval_mask(dataset, intervals)
+
+    # Filter expression; an invalid one is reported and ignored
+    if expression_text(expression):
+        try:
+            keep &= expression_mask(dataset, expression)
+        except ValueError as e:
+            print("Error in filter expression:", str(e))
+
+    return keep
+
+
+def row_filter(dataset, start_dates, end_dates, time_range, day_range, temp_threshold, expression=None):
+    """Returns the memoized (mask, row numbers) for a dataset and filter state. Both are read-only."""
+    def build():
+        mask = compile_mask(dataset, start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+        rows = np.flatnonzero(mask)
+        mask.flags.writeable = False
+        rows.flags.writeable = False
+        return mask, rows
+
+    key = filter_key(dataset['id'], start_dates, end_dates, time_range, day_range, temp_threshold, expression)
+    return _masks.compute(key, build)
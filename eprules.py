@@ -0,0 +1,219 @@
+"""Fail-threshold rules for the energyplus tables.
+
+The fail-thresholds input is a comma separated list of rules:
+    25:80            more than 80 hours above 25 fails (direction defaults to above)
+    above:25:80      the same, with the direction written out
+    below:18:40      more than 40 hours below 18 fails
+    run:above:25:6   a run of more than 6 consecutive hours above 25 fails
+    episodes:above:25:3  more than 3 separate runs above 25 fail
+The run rules ("run:25:6" defaults to above) look at the filtered hours in time
+order; an hour the filters drop ends a run.
+The average summary reads the two-part form differently: "800:1" is a peak
+limit (no value may exceed 800) and any other "T:H" an average limit (the
+average must not exceed T). The compliance overview reads "T:1" as a peak limit
+too (see peak_rules), so a preset such as DQLS CO2 passes or fails alike in both.
+
+The text is parsed once into typed Rule tuples (memoized by text) and all rules
+are evaluated for all selected zones together, from the sorted-value index of
+the current filter state (see epengine.sorted_index). A threshold sweep
+("20:32:0.5") is just one rule per swept threshold, evaluated the same way.
+
+Named presets (PMV, DQLS T, DQLS CO2) form a rule library. More presets, or
+changed ones, come from a JSON file (EP_RULES_FILE, default compliance_rules.json
+next to this module) mapping a name to its bands, thresholds and the parameter
+it applies to (matched as a case-insensitive substring):
+    {"CIBSE TM52": {"parameter": "Operative Temperature",
+                    "bands": "26,28", "thresholds": "run:above:28:3,26:90"}}
+"""
+import json
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+import epengine
+
+DIRECTIONS = ('above', 'below')
+MEASURES = {'hours': 'Hours', 'run': 'Longest Run', 'episodes': 'Episodes'}  # Rule measure -> label
+MAX_SWEEP_STEPS = 500  # Thresholds evaluated by one sweep
+RULES_FILE = os.environ.get(
+    'EP_RULES_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compliance_rules.json')
+)
+
+# Built-in presets, in the order of the preset buttons
+BUILTIN_PRESETS = {
+    'PMV': {'parameter': 'PMV', 'bands': '-1,1', 'thresholds': 'above:1:20,below:-1:20'},
+    'DQLS T': {'parameter': 'Operative Temperature', 'bands': '18,19,22,25,30', 'thresholds': '25:80,28:40'},
+    'DQLS CO2': {'parameter': 'CO2', 'bands': '600,800,1000,2000', 'thresholds': '800:1,2000:1'},
+}
+
+# kind: 'above' or 'below'; hours: the allowed total hours, longest run or episodes;
+# implicit: the direction was not written ("25:80"); measure: 'hours', 'run' or 'episodes'
+Rule = namedtuple('Rule', ['kind', 'threshold', 'hours', 'implicit', 'measure'], defaults=('hours',))
+
+
+def rule_text(rule):
+    """Short description of a rule's condition, e.g. '> 25.0' or 'Longest Run > 25.0'."""
+    measure = '' if rule.measure == 'hours' else MEASURES[rule.measure] + ' '
+    return f'{measure}{"<" if rule.kind == "below" else ">"} {rule.threshold}'
+
+
+def rule_label(rule):
+    """Column label of a rule in the band table, e.g. 'Fail > 25.0' or 'Fail Longest Run > 25.0'."""
+    return f'Fail {rule_text(rule)}'
+
+
+def needs_timeline(rules):
+    """True when any rule is a run rule, which needs the readings in time order (see epengine.zone_timeline)."""
+    return any(rule.measure != 'hours' for rule in rules)
+
+
+@lru_cache(maxsize=64)
+def parse_rules(text):
+    """Parses the fail-thresholds text into a tuple of Rules, skipping (and printing) invalid entries."""
+    rules = []
+    for pair in (text or '').split(','):
+        parts = [p.strip() for p in pair.split(':')]  # Clean input by removing spaces
+        if parts == ['']:
+            continue
+        try:
+            if len(parts) == 2:
+                value, hours = parts
+                rules.append(Rule('above', float(value), int(hours), True))
+            elif len(parts) == 3 and parts[0].lower() in MEASURES:
+                measure, value, hours = parts
+                rules.append(Rule('above', float(value), int(hours), False, measure.lower()))
+            elif len(parts) == 3:
+                direction, value, hours = parts
+                direction = direction.lower()
+                if direction not in DIRECTIONS:
+                    print(f"Skipping invalid threshold entry: {pair}")  # Debugging
+                    continue
+                rules.append(Rule(direction, float(value), int(hours), False))
+            elif len(parts) == 4:
+                measure, direction, value, hours = parts
+                measure, direction = measure.lower(), direction.lower()
+                if measure not in MEASURES or direction not in DIRECTIONS:
+                    print(f"Skipping invalid threshold entry: {pair}")  # Debugging
+                    continue
+                rules.append(Rule(direction, float(value), int(hours), False, measure))
+            else:
+                print(f"Unexpected format in fail thresholds: {pair}")  # Debugging
+        except ValueError:
+            print(f"Skipping invalid threshold entry: {pair}")  # Debugging
+    return tuple(rules)
+
+
+def is_peak_rule(rule):
+    """True for an implicit "T:1" rule, which the average summary and compliance overview read as a peak limit."""
+    return rule.implicit and rule.hours == 1
+
+
+def peak_rules(rules):
+    """The rules with every peak rule turned into 0 allowed hours above T, so any reading above T fails."""
+    return tuple(rule._replace(hours=0) if is_peak_rule(rule) else rule for rule in rules)
+
+
+def average_rules(rules):
+    """Splits the implicit rules into (average thresholds, peak threshold) as the average summary reads them.
+
+    "T:1" is a peak limit (the lowest one binds), any other "T:H" an average limit.
+    """
+    averages = []
+    peak = None
+    for rule in rules:
+        if not rule.implicit:
+            continue
+        if is_peak_rule(rule):
+            peak = rule.threshold if peak is None else min(peak, rule.threshold)
+        else:
+            averages.append(rule.threshold)
+    return averages, peak
+
+
+def parse_sweep(text):
+    """Parses a sweep range "start:stop:step" (e.g. "20:32:0.5") into the thresholds, stop included.
+
+    Returns an empty list (and prints why) for invalid or too long ranges.
+    """
+    try:
+        start, stop, step = [float(p) for p in (text or '').split(':')]
+    except ValueError:
+        print(f"Invalid sweep range: {text}")  # Debugging
+        return []
+    if step <= 0 or stop < start:
+        print(f"Invalid sweep range: {text}")  # Debugging
+        return []
+
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    if count > MAX_SWEEP_STEPS:
+        print(f"Sweep range {text} has {count} steps (max {MAX_SWEEP_STEPS})")  # Debugging
+        return []
+    return [round(start + i * step, 10) for i in range(count)]
+
+
+def sweep_rules(thresholds, direction):
+    """One rule per swept threshold, so a sweep is evaluated like any other rule set."""
+    return tuple(Rule(direction, float(t), 0, False) for t in thresholds)
+
+
+def load_rule_library(path=None):
+    """Returns the preset library: the built-in presets updated with the presets in the rules file, if any."""
+    path = path or RULES_FILE
+    library = {name: dict(preset) for name, preset in BUILTIN_PRESETS.items()}
+    if not os.path.exists(path):
+        return library
+
+    try:
+        with open(path, encoding='utf-8') as f:
+            presets = json.load(f)
+    except (OSError, ValueError) as e:
+        print("Error reading rule library:", str(e))
+        return library
+
+    for name, preset in presets.items():
+        if not isinstance(preset, dict) or not preset.get('thresholds'):
+            print(f"Skipping invalid preset: {name}")  # Debugging
+            continue
+        library[name] = {'parameter': preset.get('parameter', ''), 'bands': preset.get('bands', ''),
+                         'thresholds': preset['thresholds']}
+    return library
+
+
+def preset_parameter(preset, parameters):
+    """The first dataset parameter whose name contains the preset's parameter, or None."""
+    wanted = preset.get('parameter', '').lower()
+    for parameter in parameters:
+        if wanted and wanted in parameter.lower():
+            return parameter
+    return None
+
+
+def evaluate_rules(index, zones, rules, timeline=None, bands=()):
+    """Evaluates every rule for every zone in one batch from a sorted-value index.
+
+    Run rules also need timeline, the zones' filtered readings in time order (see
+    epengine.zone_timeline); they are all run-length encoded together.
+    Returns the per-zone aggregates of epengine.zone_stats (band counts for bands) plus,
+    with rows following zones and columns following rules:
+        'hours'   int   hours beyond each threshold (longest run or episodes for run rules)
+        'fail'    bool  hours > the rule's allowed hours
+    """
+    thresholds = [rule.threshold for rule in rules]
+    stats = dict(epengine.zone_stats(index, zones, bands, thresholds, [rule.kind == 'above' for rule in rules]))
+    hours = stats['exceed'].copy()  # The cached stats are read-only
+
+    for r, rule in enumerate(rules):
+        if rule.measure == 'hours':
+            continue
+        threshold = np.asarray(thresholds[r], dtype=timeline.dtype)
+        with np.errstate(invalid='ignore'):  # NaN (missing or filtered out) is never beyond a threshold
+            condition = timeline > threshold if rule.kind == 'above' else timeline < threshold
+        longest, episodes = epengine.run_lengths(condition)
+        hours[:, r] = np.where(stats['present'], longest if rule.measure == 'run' else episodes, 0)
+
+    stats['hours'] = hours
+    stats['fail'] = hours > np.array([rule.hours for rule in rules], dtype=np.int64)
+    return stats
@@ -0,0 +1,101 @@
+"""Cached stages of the energyplus computation graph.
+
+Every interaction runs the same chain of stages:
+    mask -> sorted values -> zone stats -> figure / tables
+(plus the expression and count cube stages beside them). Each stage memoizes
+its results by its own inputs, and a stage's key includes the key of the stage
+it reads from. A change therefore only recomputes the stages downstream of
+it: toggling a zone reuses the mask and the sorted values, editing the bands
+reuses those and recomputes only the zone stats and the figure.
+
+Every stage counts its hits and misses and prints the counts on each miss.
+Concurrent callbacks asking a stage for the same key wait for one build
+instead of each building it (one filter evaluation per UI change).
+Stages holding large arrays are also bounded by bytes, not just entry count.
+"""
+import threading
+from collections import OrderedDict
+
+STAGES = []  # Every stage, in creation order, for report()
+
+
+class Stage:
+    """One cached stage: an LRU memo of results by key with hit and miss counts.
+
+    With max_bytes, sizeof(result) gives each result's size in bytes and the least recently
+    used results are dropped until the stage fits (the newest result is always kept).
+    """
+
+    def __init__(self, name, max_entries, max_bytes=None, sizeof=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._pending = {}  # key -> threading.Event set when its build finishes
+        self._lock = threading.Lock()
+        STAGES.append(self)
+
+    def get(self, key):
+        """Returns the cached result for key, or None; counts the hit or miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        print(f"Stage '{self.name}': miss ({self.hits} hits, {self.misses} misses)")
+        return None
+
+    def put(self, key, value):
+        """Stores a result, evicting the least recently used ones past max_entries or max_bytes."""
+        with self._lock:
+            self.nbytes -= self._sizes.pop(key, 0)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if self.max_bytes is not None:
+                self._sizes[key] = self.sizeof(value)
+                self.nbytes += self._sizes[key]
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or
+                                              (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+                oldest, _ = self._entries.popitem(last=False)
+                self.nbytes -= self._sizes.pop(oldest, 0)
+        return value
+
+    def compute(self, key, build):
+        """Returns the cached result for key, or builds, stores and returns it.
+
+        build runs outside the lock, so a slow stage never blocks lookups of other keys.
+        Callers asking for a key that is being built wait for that build and count a hit.
+        """
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                pending = self._pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = self._pending[key] = threading.Event()
+                    break
+            pending.wait()  # Then look again; if that build failed, build it here
+
+        print(f"Stage '{self.name}': miss ({self.hits} hits, {self.misses} misses)")
+        try:
+            return self.put(key, build())
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+
+def report():
+    """Prints the hit and miss counts of every stage."""
+    for stage in STAGES:
+        size = '' if stage.max_bytes is None else f" ({stage.nbytes / 2**20:.1f} of {stage.max_bytes / 2**20:.0f} MB)"
+        print(f"Stage '{stage.name}': {stage.hits} hits, {stage.misses} misses, {len(stage._entries)} cached{size}")
@@ -1,10 +1,9 @@
 import pandas as pd
 import plotly.graph_objects as go
-import base64
-import io
 import dash
 from dash import Dash, dcc, html, Input, Output, State, ALL, dash_table
 from datetime import datetime
+import epdata
 
 app = Dash(__name__)
 
@@ -18,6 +17,7 @@ app.layout = html.Div([
         children=html.Button('Upload CSV File'),
         multiple=False
     ),
+    dcc.Store(id='dataset-id'),  # Id of the parsed upload held by epdata
     
     dcc.Dropdown(id='parameter-dropdown', placeholder="Select Parameter"),
 
@@ -84,57 +84,40 @@ app.layout = html.Div([
 
 @app.callback(
     [Output('parameter-dropdown', 'options'),
-     Output('zone-checklist', 'options'),
-     Output('zone-checklist', 'value')],
-    [Input('upload-data', 'contents'),
-     Input('zone-filter', 'value'),
-     Input('filter-mode', 'value')]  # <-- Added filter mode toggle
+     Output('dataset-id', 'data')],
+    Input('upload-data', 'contents')
 )
-def parse_data(contents, filter_word, filter_mode):  # <-- Updated function signature
+def parse_data(contents):
+    """Parses an upload once; zone filtering runs against the cached dataset."""
     global df
     if contents is None:
-        return [], [], []
-    
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    csv_data = io.StringIO(decoded.decode('utf-8'))
-    
-    try:
-        df_raw = pd.read_csv(csv_data, skiprows=2, header=None)
-        param_names = df_raw.iloc[0, 1:].tolist()
-        zone_names = df_raw.iloc[1, 1:].tolist()
-        new_columns = ['Datetime'] + [f'{zone} {param}' for zone, param in zip(zone_names, param_names)]
-        df = df_raw.iloc[2:].reset_index(drop=True)
-        
-        df.columns = new_columns
-        df.columns = [col.strip() for col in new_columns]  # Remove extra spaces
-        for col in df.columns[1:]:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        df['Datetime'] = df['Datetime'].astype(str).str[7:]
-        df['Datetime'] = pd.to_datetime(df['Datetime'], format='%b %d %I:%M %p', errors='coerce')
-        df = df.dropna(subset=['Datetime'])
-        
-        df['Date'] = df['Datetime'].dt.date  # Extract the date without time
-        
-        parameters = set(param_names)
-        zones = set(zone_names)
+        return [], None
 
-        # **Apply Include/Exclude Filter**
-        if filter_word:
-            filter_word = filter_word.lower().strip()  # Normalize input
-            if filter_mode == 'exclude':
-                zones = [z for z in zones if filter_word not in z.lower()]  # Remove matching zones
-            elif filter_mode == 'include':
-                zones = [z for z in zones if filter_word in z.lower()]  # Keep only matching zones
-
-        return ([{'label': p, 'value': p} for p in parameters],
-                [{'label': z, 'value': z} for z in zones],
-                list(zones))
-    
+    try:
+        dataset = epdata.load_dataset(contents)
     except Exception as e:
         print("Error parsing CSV:", str(e))
-        return [], [], []
+        return [], None
+
+    df = epdata.dataset_frame(dataset)
+    return [{'label': p, 'value': p} for p in dataset['parameters']], dataset['id']
+
+
+@app.callback(
+    [Output('zone-checklist', 'options'),
+     Output('zone-checklist', 'value')],
+    [Input('dataset-id', 'data'),
+     Input('zone-filter', 'value'),
+     Input('filter-mode', 'value')]
+)
+def filter_zone_checklist(dataset_id, filter_word, filter_mode):
+    dataset = epdata.get_dataset(dataset_id)
+    if dataset is None:
+        return [], []
+
+    # **Apply Include/Exclude Filter**
+    zones = epdata.filter_zones(dataset['zones'], filter_word, filter_mode)
+    return [{'label': z, 'value': z} for z in zones], zones
 
 @app.callback(
     Output('date-picker-container', 'children'),